@@ -1,6 +1,11 @@
+from .batch import DistributionBatch
 from .conditional import ConditionalDistribution
 from .distribution import Distribution
 from .max_entropy import MaxEntropy
 from .node import Node, sort_nodes
+from .parallel import FitError, fit_many
 from .smoother import Smoother
-from .utils import DerivativeObjective, MassConstraint, MomentConstraint
\ No newline at end of file
+from .utils import (
+    DerivativeObjective, EntropyObjective, LowRankHessian, MassConstraint, 
+    MomentConstraint
+)
\ No newline at end of file
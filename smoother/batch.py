@@ -0,0 +1,341 @@
+"""# Distribution batch
+
+A `DistributionBatch` holds many distributions defined on a shared grid in a
+single 2-D array, so that their methods can be evaluated for all
+distributions at once.
+"""
+
+from .distribution import Distribution, trapezoid_weights
+
+import numpy as np
+from scipy.special import entr
+
+
+class DistributionBatch():
+    """
+    Parameters and attributes
+    -------------------------
+    x : (num,) np.array
+        Sorted grid shared by all distributions in the batch.
+
+    f_x : (# distributions x num) np.array
+        PDF of each distribution for the points in `x`. Each row is
+        normalized in the same way as `Distribution.f_x`.
+
+    Additional attributes
+    ---------------------
+    F_x : (# distributions x num) np.array
+        CDF of each distribution for the points in `x`.
+
+    Examples
+    --------
+    ```python
+    import numpy as np
+    from smoother import DistributionBatch
+
+    x = np.linspace(-3, 3)
+    batch = DistributionBatch(x, np.exp(-(x - [[-1], [0], [1]])**2))
+    batch.mean() # (3,) array of means
+    batch[0].cdf(0) # rows behave like a `Distribution`
+    ```
+    """
+    def __init__(self, x, f_x):
+        self.x = x
+        self.f_x = f_x
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, x):
+        self._x = x
+        self._w = trapezoid_weights(x)
+
+    @property
+    def f_x(self):
+        return self._f_x
+
+    @f_x.setter
+    def f_x(self, f_x):
+        f_x = np.atleast_2d(f_x)
+        self._f_x = f_x / (f_x @ self._w).reshape(-1, 1)
+        self._F_x = None
+
+    @property
+    def F_x(self):
+        """
+        See `Distribution.F_x`; computed for every row and cached until `f_x`
+        changes.
+        """
+        if self._F_x is None:
+            f_x = (self._f_x[:, :-1] + self._f_x[:, 1:]) * np.diff(self.x)
+            a = np.cumsum(np.insert(f_x, 0, 0, axis=1), axis=1)
+            self._F_x = a / a[:, -1:]
+        return self._F_x
+
+    def __len__(self):
+        return self._f_x.shape[0]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, key):
+        """
+        Parameters
+        ----------
+        key : int, slice, or array-like
+            Index of the distributions.
+
+        Returns
+        -------
+        distribution : `Distribution` or `DistributionBatch`
+            An integer key returns a `Distribution` whose `f_x` is a view of
+            the corresponding row. Other keys return a `DistributionBatch`.
+        """
+        if isinstance(key, (int, np.integer)):
+            dist = Distribution.__new__(Distribution)
+            dist.x, dist._f_x = self.x, self._f_x[key]
+            dist._clear_cache()
+            return dist
+        batch = self.__class__.__new__(self.__class__)
+        batch.x, batch._f_x, batch._F_x = self.x, self._f_x[key], None
+        return batch
+
+    def rvs(self, size=1, random_state=None):
+        """
+        Parameters
+        ----------
+        size : int or tuple of ints, default=1
+            Number of samples to draw from each distribution.
+
+        random_state : None, int, np.random.SeedSequence, or np.random.Generator, default=None
+            Seed or generator passed to `np.random.default_rng`.
+
+        Returns
+        -------
+        sample : (# distributions,) or (# distributions x size) np.array
+            Random samples. If `size` is 1, one sample is drawn from each
+            distribution.
+        """
+        rng = np.random.default_rng(random_state)
+        shape = (len(self),) + (() if size == 1 else tuple(np.atleast_1d(size)))
+        return self._ppf_rows(rng.random(shape))
+
+    def mean(self):
+        """
+        Returns
+        -------
+        mean : (# distributions,) np.array
+        """
+        return self.moment(1)
+
+    def var(self):
+        """
+        Returns
+        -------
+        variance : (# distributions,) np.array
+        """
+        return self.moment(2, 'central')
+
+    def std(self):
+        """
+        Returns
+        -------
+        standard deviation : (# distributions,) np.array
+        """
+        return self.moment(2, 'central', True)
+
+    def median(self):
+        """
+        Returns
+        -------
+        median : (# distributions,) np.array
+        """
+        return self.ppf(.5)
+
+    def entropy(self):
+        """
+        Returns
+        -------
+        entropy : (# distributions,) np.array
+            Differential entropy of each distribution; see 
+            `Distribution.entropy`.
+        """
+        mass = (self._f_x @ self._w).reshape(-1, 1)
+        return entr(self._f_x / mass) @ self._w
+
+    def pdf(self, x):
+        """
+        Parameters
+        ----------
+        x : float or np.array
+            Points shared by all distributions.
+
+        Returns
+        -------
+        pdf(x) : (# distributions,) or (# distributions x shape of `x`) np.array
+            Probability density function of `x` for each distribution.
+        """
+        return self._interp(x, self._f_x, 0, 0)
+
+    def cdf(self, x):
+        """
+        Parameters
+        ----------
+        x : float or np.array
+            Points shared by all distributions.
+
+        Returns
+        -------
+        cdf(x) : (# distributions,) or (# distributions x shape of `x`) np.array
+            Cumulative distribution function of `x` for each distribution.
+        """
+        return self._interp(x, self.F_x, 0, 1)
+
+    def sf(self, x):
+        """
+        Parameters
+        ----------
+        x : float or np.array
+
+        Returns
+        -------
+        sf(x) : (# distributions,) or (# distributions x shape of `x`) np.array
+            Survival function; `1-self.cdf`.
+        """
+        return 1 - self.cdf(x)
+
+    def _interp(self, x, y, left, right):
+        """
+        Batch version of `Distribution._interp`; `y` has one row per
+        distribution.
+        """
+        x = np.asarray(x, dtype=float)
+        ub = np.clip(
+            np.searchsorted(self.x, x, side='right'), 1, self.x.shape[0]-1
+        )
+        lb = ub - 1
+        x_lb, x_ub = self.x[lb], self.x[ub]
+        w_ub = (x - x_lb) / (x_ub - x_lb)
+        y_x = y[:, lb] + w_ub * (y[:, ub] - y[:, lb])
+        y_x = np.where(x < self.x[0], left, y_x)
+        return np.where(self.x[-1] < x, right, y_x)
+
+    def ppf(self, q):
+        """
+        Parameters
+        ----------
+        q : float between 0. and 1. or np.array
+            Quantiles shared by all distributions.
+
+        Returns
+        -------
+        ppf(q) : (# distributions,) or (# distributions x shape of `q`) np.array
+            Percent point function; inverse of `self.cdf`.
+        """
+        q = np.asarray(q, dtype=float)
+        return self._ppf_rows(np.broadcast_to(q, (len(self),) + q.shape))
+
+    def isf(self, q):
+        """
+        Parameters
+        ----------
+        q : float between 0. and 1. or np.array
+
+        Returns
+        -------
+        isf(q) : (# distributions,) or (# distributions x shape of `q`) np.array
+            Inverse survival function.
+        """
+        return self.ppf(1 - np.asarray(q, dtype=float))
+
+    def _ppf_rows(self, q):
+        """
+        Parameters
+        ----------
+        q : (# distributions x ...) np.array
+            Quantiles; row `i` is evaluated for distribution `i`.
+
+        Returns
+        -------
+        ppf(q) : np.array
+            Same shape as `q`.
+        """
+        return _ppf_rows(self.x, self.F_x, q)
+
+    def moment(self, degree=1, type_='raw', norm=False):
+        """
+        Parameters
+        ----------
+        degree : int, default=1
+            The degree of the moment, e.g. first (mean), second (var).
+        type_ : str, default='raw'
+            Type of moment; `'raw'`, `'central'`, or `'standardized'`.
+        norm : bool, default=False
+            Indicates whether to return the norm of the moment. If `True`,
+            return `moment**(1/degree)`.
+
+        Returns
+        -------
+        moment : (# distributions,) np.array
+        """
+        if type_ == 'raw':
+            val = self.x
+        elif type_ == 'central':
+            val = self.x - self.mean().reshape(-1, 1)
+        elif type_ == 'standardized':
+            val = (
+                (self.x - self.mean().reshape(-1, 1))
+                / self.std().reshape(-1, 1)
+            )
+        else:
+            raise ValueError(
+                "type_ must be 'raw', 'central', or 'standardized', got {}"
+                .format(type_)
+            )
+        w_f_x = self._w * self._f_x
+        val = (val**degree * w_f_x).sum(axis=-1) / w_f_x.sum(axis=-1)
+        return val**(1/degree) if norm else val
+
+
+def _ppf_rows(x, F_x, q):
+    """
+    Parameters
+    ----------
+    x : (num,) np.array
+        Sorted grid.
+
+    F_x : (# distributions x num) np.array
+        CDF of each distribution for the points in `x`.
+
+    q : (# distributions x ...) np.array
+        Quantiles; row `i` is evaluated for distribution `i`.
+
+    Returns
+    -------
+    ppf(q) : np.array
+        Same shape as `q`.
+
+    Notes
+    -----
+    The segment of every quantile in every row is located with a vectorized
+    binary search, i.e. `np.searchsorted(F_x[i], q[i], side='left')` for all
+    rows at once, in `log2(num)` steps and memory proportional to `q`.
+    """
+    n, num = F_x.shape
+    rows = np.arange(n).reshape((n,) + (1,)*(q.ndim-1))
+    lo = np.zeros(q.shape, dtype=np.intp)
+    hi = np.full(q.shape, num, dtype=np.intp)
+    while (lo < hi).any():
+        mid = (lo + hi) // 2
+        below = F_x[rows, np.minimum(mid, num-1)] < q
+        lo, hi = np.where(below, mid+1, lo), np.where(below, hi, mid)
+    ub = np.clip(lo, 1, num-1)
+    lb = ub - 1
+    F_lb, F_ub = F_x[rows, lb], F_x[rows, ub]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w_ub = np.clip((q - F_lb) / (F_ub - F_lb), 0, 1)
+    x_q = x[lb] + w_ub * (x[ub] - x[lb])
+    x_q = np.where(q <= 0, x[0], x_q)
+    return np.where(1 <= q, x[-1], x_q)
@@ -11,12 +11,32 @@ defined in `scipy.stats`:
 - `ppf`
 """
 
-from .distribution import Distribution
+from .batch import DistributionBatch, _ppf_rows
+from .distribution import trapezoid_weights
 
 import numpy as np
+from scipy import sparse
+from scipy.spatial.distance import cdist
+from scipy.special import comb
+from sklearn.model_selection import KFold
 from sklearn.metrics.pairwise import pairwise_kernels
+from sklearn.neighbors import NearestNeighbors
 
 import json
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# binary model store: header, kernel parameters as JSON padded to a multiple
+# of 8 bytes, then little-endian float64 `x`, `given`, and `f_x` in C order
+_MAGIC = b'SMCOND\x00\x00'
+_VERSION = 1
+_HEADER = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('params_size', '<u4'),
+    ('params_crc', '<u4'), ('data_crc', '<u4'), 
+    ('n', '<u8'), ('n_features', '<u8'), ('num', '<u8')
+])
 
 
 def linspace(distributions, num=50):
@@ -54,12 +74,31 @@ def wasserstein(true_dist, estimated_dist, num=50):
     -------
     distance : float
         Negative Wasserstein distance between the true and estimated 
-        distributions.
+        distributions, i.e. the trapezoidal integral of the absolute 
+        difference between their CDFs.
     """
     x = linspace([true_dist, estimated_dist], num)
     true_cdf, estimated_cdf = true_dist.cdf(x), estimated_dist.cdf(x)
-    return -abs(true_cdf - estimated_cdf).sum() * (x[-1] - x[0]) / num
+    return _wasserstein_cdf(true_cdf, estimated_cdf, x)
     
+def _wasserstein_cdf(true_cdf, estimated_cdf, x):
+    """
+    Parameters
+    ----------
+    true_cdf, estimated_cdf : (# distributions x num) np.array
+        CDFs evaluated on `x`.
+
+    x : (num,) np.array
+        Sorted grid, not necessarily evenly spaced.
+
+    Returns
+    -------
+    distance : (# distributions,) np.array
+        Negative Wasserstein distance, i.e. the trapezoidal integral of the
+        absolute difference between the CDFs over `x`.
+    """
+    return -abs(true_cdf - estimated_cdf) @ trapezoid_weights(x)
+
 metrics = dict(
     wasserstein=wasserstein
 )
@@ -86,6 +125,16 @@ class ConditionalDistribution():
         Metric to use for scoring the conditional distribution. Currently,
         only `'wasserstein'` is implemented.
 
+    n_neighbors : int or None, default=None
+        If set, predictions use only the `n_neighbors` nearest known 
+        distributions. Only for the `'rbf'` and `'laplacian'` metrics.
+
+    radius : float or None, default=None
+        If set, predictions use only the known distributions within `radius`
+        (Euclidean distance for `'rbf'`, Manhattan for `'laplacian'`) of the 
+        scaled query. If both `n_neighbors` and `radius` are set, neighbors 
+        must satisfy both. A query with no neighbors predicts NaN.
+
     Additional attributes
     ---------------------
     given : (# known distributions x # conditional features) np.array
@@ -99,17 +148,31 @@ class ConditionalDistribution():
     f_x : (# known distributions x shape of `x`) np.array
         PDF of the known distributions for the points in `x`. Set during 
         `fit`.
+
+    Notes
+    -----
+    With `n_neighbors` or `radius`, `fit` builds a spatial index (a KD-tree 
+    or ball tree, see `sklearn.neighbors.NearestNeighbors`) over the scaled 
+    `given`, and the kernel is a sparse matrix with one row of neighbor 
+    weights per query. This reduces the cost of `predict` from 
+    O(# queries * # known) to about O(# queries * n_neighbors * log # known).
+    The index is rebuilt if `metric` or `feature_scale` change.
     """
     def __init__(
             self, metric='linear', gamma=1, coef0=1, feature_scale=1, 
-            eval_metric='wasserstein'
+            eval_metric='wasserstein', n_neighbors=None, radius=None
         ):
         self.metric = metric
         self.gamma = gamma
         self.coef0 = coef0
         self.feature_scale = feature_scale
         self.eval_metric = eval_metric
+        self.n_neighbors = n_neighbors
+        self.radius = radius
         self.given, self.x, self.f_x = None, None, None
+        self._index, self._index_key, self._index_size = None, None, 0
+        self._given_buffer, self._f_x_buffer = None, None
+        self._summary, self._cumulative = None, None
         
     def fit(self, given, distributions, num=50):
         """
@@ -126,13 +189,192 @@ class ConditionalDistribution():
         num : int, default=50
             Number of points used to approximate conditional distributions.
 
+        Returns
+        -------
+        self
+        """
+        x = linspace(distributions, num)
+        return self.fit_pdf(
+            given, x, np.array([dist.pdf(x) for dist in distributions])
+        )
+
+    def partial_fit(self, given, distributions, num=50):
+        """
+        Add known conditional distributions to a fitted conditional 
+        distribution, or fit it if it has not been fit.
+
+        Parameters
+        ----------
+        given : (# new distributions x # conditional features) np.array
+            Values of the features on which the new distributions are 
+            conditioned.
+
+        distributions : list of distribution objects
+            New known conditional distributions.
+
+        num : int, default=50
+            Number of points used to approximate conditional distributions if
+            the conditional distribution has not been fit. Otherwise, the 
+            number of points in `x` is unchanged.
+
+        Returns
+        -------
+        self
+
+        Notes
+        -----
+        `given` and `f_x` are views into buffers whose capacity doubles as 
+        needed, so appending takes amortized time proportional to the new
+        rows. The new distributions are evaluated on `x`. Existing 
+        distributions are never re-evaluated; if the new distributions 
+        extend beyond `x`, `x` is widened and the existing densities are 
+        linearly interpolated onto it. A neighbor index is updated 
+        incrementally; see `_sparse_kernel`.
+        """
+        if self.given is None:
+            return self.fit(given, distributions, num)
+        start, stop = linspace(distributions, 2)
+        if start < self.x[0] or self.x[-1] < stop:
+            self._regrid(np.linspace(
+                min(start, self.x[0]), max(stop, self.x[-1]), self.x.shape[0]
+            ))
+        self._append(
+            given, np.array([dist.pdf(self.x) for dist in distributions])
+        )
+        if self.n_neighbors is not None or self.radius is not None:
+            self._neighbor_index()
+        return self
+
+    def _append(self, given, f_x):
+        """
+        Appends rows to `self.given` and `self.f_x`, growing their buffers if
+        necessary.
+
+        Parameters
+        ----------
+        given : (# new distributions x # conditional features) np.array
+
+        f_x : (# new distributions x shape of `x`) np.array
+        """
+        n, n_new = self.given.shape[0], given.shape[0]
+        if (
+            getattr(self, '_given_buffer', None) is None
+            or self.given.base is not self._given_buffer 
+            or self.f_x.base is not self._f_x_buffer
+        ):
+            self._given_buffer, self._f_x_buffer = self.given, self.f_x
+        if self._given_buffer.shape[0] < n + n_new:
+            capacity = max(2*self._given_buffer.shape[0], n + n_new)
+            given_buffer = np.empty(
+                (capacity, self.given.shape[1]), 
+                dtype=np.result_type(self.given, given, float)
+            )
+            given_buffer[:n] = self.given
+            f_x_buffer = np.empty((capacity, self.x.shape[0]))
+            f_x_buffer[:n] = self.f_x
+            self._given_buffer, self._f_x_buffer = given_buffer, f_x_buffer
+        self._given_buffer[n:n+n_new] = given
+        self._f_x_buffer[n:n+n_new] = f_x
+        self.given = self._given_buffer[:n+n_new]
+        self.f_x = self._f_x_buffer[:n+n_new]
+
+    def _regrid(self, x):
+        """
+        Linearly interpolates `self.f_x` onto a wider grid `x`; densities are
+        zero outside the old grid.
+
+        Parameters
+        ----------
+        x : (shape of `self.x`) np.array
+        """
+        ub = np.clip(
+            np.searchsorted(self.x, x, side='right'), 1, self.x.shape[0]-1
+        )
+        lb = ub - 1
+        w_ub = (x - self.x[lb]) / (self.x[ub] - self.x[lb])
+        inside = (self.x[0] <= x) & (x <= self.x[-1])
+        f_x = self.f_x[:, lb] + w_ub * (self.f_x[:, ub] - self.f_x[:, lb])
+        self.f_x = np.where(inside, f_x, 0)
+        self.x = x
+
+    def fit_family(self, given, family, params, num=50):
+        """
+        Fit the conditional distribution using known conditional 
+        distributions from one `scipy.stats` family, evaluating the support 
+        and densities of all distributions in single broadcast calls.
+
+        Parameters
+        ----------
+        given : (# known distributions x # conditional features) np.array
+            Sets the `given` attribute.
+
+        family : scipy.stats.rv_continuous
+            Distribution family, e.g. `scipy.stats.norm`.
+
+        params : dict
+            Maps the names of `family`'s parameters (e.g. `'loc'`, `'scale'`) 
+            to scalars or (# known distributions,) arrays.
+
+        num : int, default=50
+            Number of points used to approximate conditional distributions.
+
+        Returns
+        -------
+        self
+
+        Examples
+        --------
+        ```python
+        import numpy as np
+        from scipy.stats import norm
+        from smoother import ConditionalDistribution
+
+        given = np.random.normal(size=(10000, 1))
+        cond = ConditionalDistribution('rbf').fit_family(
+            given, norm, dict(loc=given[:, 0], scale=1)
+        )
+        ```
+        """
+        params = {
+            key: np.asarray(value, dtype=float).reshape(-1, 1) 
+            for key, value in params.items()
+        }
+        # same bounds as `linspace`
+        lb, ub = family.ppf(0, **params), family.ppf(1, **params)
+        lb = np.where(lb == -np.inf, family.ppf(.01, **params), lb)
+        ub = np.where(ub == np.inf, family.ppf(.99, **params), ub)
+        x = np.linspace(lb.min(), ub.max(), num)
+        f_x = np.broadcast_to(family.pdf(x, **params), (given.shape[0], num))
+        return self.fit_pdf(given, x, f_x)
+
+    def fit_pdf(self, given, x, f_x):
+        """
+        Fit the conditional distribution using a precomputed density matrix.
+
+        Parameters
+        ----------
+        given : (# known distributions x # conditional features) np.array
+            Sets the `given` attribute.
+
+        x : (num,) np.array
+            Sorted points at which the densities are evaluated. Sets the `x`
+            attribute.
+
+        f_x : (# known distributions x num) np.array
+            PDF of the known distributions for the points in `x`. Sets the 
+            `f_x` attribute.
+
         Returns
         -------
         self
         """
         self.given = given
-        self.x = linspace(distributions, num)
-        self.f_x = np.array([dist.pdf(self.x) for dist in distributions])
+        self.x = np.asarray(x, dtype=float)
+        self.f_x = np.asarray(f_x, dtype=float)
+        self._index, self._summary, self._cumulative = None, None, None
+        self._moment_table()
+        if self.n_neighbors is not None or self.radius is not None:
+            self._neighbor_index()
         return self
     
     def predict(self, given):
@@ -146,24 +388,350 @@ class ConditionalDistribution():
 
         Returns
         -------
-        conditional distributions : list of smoother.Distribution
-            Estimated conditional distributions.
+        conditional distributions : smoother.DistributionBatch
+            Estimated conditional distributions. Indexing or iterating over 
+            the batch yields `smoother.Distribution`s.
+        """
+        given = given.reshape(1, -1) if len(given.shape) == 1 else given
+        return DistributionBatch(self.x, self._kernel(given) @ self.f_x)
+
+    def predict_chunks(
+            self, given, max_memory=2**28, n_jobs=1, backend='threads'
+        ):
+        """
+        Predict conditional distributions for a large number of queries in 
+        blocks, so that the full kernel matrix is never held in memory.
+
+        Parameters
+        ----------
+        given : (# estimated distributions x # conditional features) np.array
+            Values of features on which to condition.
+
+        max_memory : int, default=2**28
+            Approximate memory budget in bytes for each block's kernel matrix
+            and predicted densities. Each query row takes about 
+            `8 * (2 * # known distributions + len(x))` bytes.
+
+        n_jobs : int or None, default=1
+            Number of blocks predicted concurrently. `None` or `-1` uses all
+            CPUs. At most `2 * n_jobs` blocks are in flight at a time.
+
+        backend : str, default='threads'
+            `'threads'` or `'processes'`. Threads share the fitted arrays and
+            are efficient because the kernel and matrix product release the
+            GIL. Processes receive a pickled copy of `self` once per worker.
+
+        Returns
+        -------
+        blocks : generator of smoother.DistributionBatch
+            Estimated conditional distributions for consecutive blocks of 
+            rows of `given`, in order.
+        """
+        given = given.reshape(1, -1) if len(given.shape) == 1 else given
+        row_bytes = 8 * (2*self.given.shape[0] + self.x.shape[0])
+        chunksize = max(int(max_memory // row_bytes), 1)
+        blocks = (
+            given[i:i+chunksize] for i in range(0, given.shape[0], chunksize)
+        )
+        n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+        if n_jobs == 1:
+            for block in blocks:
+                yield self.predict(block)
+            return
+        if backend == 'threads':
+            executor = ThreadPoolExecutor(n_jobs)
+            predict = self.predict
+        elif backend == 'processes':
+            executor = ProcessPoolExecutor(
+                n_jobs, initializer=_init_worker, initargs=(self,)
+            )
+            predict = _predict_block
+        else:
+            raise ValueError(
+                "backend must be 'threads' or 'processes', got {}"
+                .format(backend)
+            )
+        with executor:
+            pending = deque()
+            for block in blocks:
+                pending.append(executor.submit(predict, block))
+                if len(pending) >= 2*n_jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def predict_moments(self, given, degrees=[1, 2], type_='raw', norm=False):
+        """
+        Predict moments of the conditional distributions without computing 
+        their densities.
+
+        Parameters
+        ----------
+        given : (# estimated distributions x # conditional features) np.array
+            Values of features on which to condition.
+
+        degrees : list of ints or np.array, default=[1, 2]
+            Degrees of the moments.
+
+        type_ : str, default='raw'
+            Type of moment; `'raw'`, `'central'`, or `'standardized'`.
+
+        norm : bool, default=False
+            Indicates whether to return the norms of the moments. If `True`, 
+            return `moment**(1/degree)` for each degree.
+
+        Returns
+        -------
+        moments : (# estimated distributions x # degrees) np.array
+            Same as `self.predict(given).moment` for each degree.
+
+        Notes
+        -----
+        The moments of a prediction are ratios of kernel-weighted sums of the
+        known distributions' power integrals, which are computed once at 
+        `fit` for degrees up to 4 about the center of `x`. Central and 
+        standardized moments are derived from them with the binomial 
+        expansion.
         """
         given = given.reshape(1, -1) if len(given.shape) == 1 else given
+        degrees = np.asarray(degrees)
+        if type_ not in ('raw', 'central', 'standardized'):
+            raise ValueError(
+                "type_ must be 'raw', 'central', or 'standardized', got {}"
+                .format(type_)
+            )
+        max_degree = max(degrees.max(initial=0), 2)
+        center, powers = self._moment_table(max_degree)
+        a = self._kernel(given) @ powers[:, :max_degree+1]
+        # moments about the center of `x`
+        a = a / a[:, :1]
+        mean = center + a[:, 1]
+        # moments about zero (raw) or the mean
+        d = center - (0 if type_ == 'raw' else mean)
+        moments = np.column_stack([
+            sum(comb(k, j) * a[:, j] * d**(k-j) for j in range(k+1))
+            for k in degrees
+        ]).reshape(given.shape[0], -1)
+        if type_ == 'standardized':
+            var = (a[:, 2] - a[:, 1]**2).reshape(-1, 1)
+            moments = moments / var**(degrees/2)
+        return moments**(1/degrees) if norm else moments
+
+    def predict_quantiles(self, given, q):
+        """
+        Predict quantiles of the conditional distributions without 
+        constructing distribution objects.
+
+        Parameters
+        ----------
+        given : (# estimated distributions x # conditional features) np.array
+            Values of features on which to condition.
+
+        q : float between 0. and 1. or np.array
+            Quantiles shared by all predictions.
+
+        Returns
+        -------
+        quantiles : (# estimated distributions,) or (# estimated distributions x shape of `q`) np.array
+            Same as `self.predict(given).ppf(q)`.
+
+        Notes
+        -----
+        The CDF of a prediction is the kernel-weighted sum of the known 
+        distributions' cumulative integrals, which are computed on first use
+        and cached (see `_cumulative_table`), divided by its total.
+        """
+        given = given.reshape(1, -1) if len(given.shape) == 1 else given
+        cumulative = self._cumulative_table()
+        F_x = self._kernel(given) @ cumulative
+        F_x = F_x / F_x[:, -1:]
+        q = np.asarray(q, dtype=float)
+        return _ppf_rows(
+            self.x, F_x, np.broadcast_to(q, (given.shape[0],) + q.shape)
+        )
+
+    def _moment_table(self, max_degree=4):
+        """
+        Parameters
+        ----------
+        max_degree : int, default=4
+            Highest power integral required.
+
+        Returns
+        -------
+        center : float
+            Midpoint of `self.x`.
+
+        powers : (# known distributions x max(4, `max_degree`)+1) np.array
+            Integrals of `(x-center)**degree * f_x` for each known 
+            distribution and degree.
+
+        Notes
+        -----
+        The table is computed at `fit`, extended for rows added by 
+        `partial_fit`, and recomputed if `x` changes.
+        """
+        table = getattr(self, '_summary', None)
+        if (
+            table is None or table[0] is not self.x 
+            or table[2].shape[1] < max_degree + 1
+        ):
+            table = (
+                self.x, (self.x[0] + self.x[-1]) / 2,
+                np.empty((0, max(4, max_degree)+1))
+            )
+        x, center, powers = table
+        if powers.shape[0] < self.f_x.shape[0]:
+            powers = np.vstack([
+                powers, 
+                (self.f_x[powers.shape[0]:] * trapezoid_weights(x)) 
+                @ (x.reshape(-1, 1) - center)**np.arange(powers.shape[1])
+            ])
+            self._summary = x, center, powers
+        return center, powers
+
+    def _cumulative_table(self):
+        """
+        Returns
+        -------
+        cumulative : (# known distributions x shape of `x`) np.array
+            Cumulative trapezoidal integrals of `f_x`.
+
+        Notes
+        -----
+        The table is as large as `f_x`, so it is computed on first use 
+        rather than at `fit`. It is extended for rows added by `partial_fit`
+        and recomputed if `x` changes.
+        """
+        table = getattr(self, '_cumulative', None)
+        if table is None or table[0] is not self.x:
+            table = self.x, np.empty((0, self.x.shape[0]))
+        x, cumulative = table
+        if cumulative.shape[0] < self.f_x.shape[0]:
+            f_x = self.f_x[cumulative.shape[0]:]
+            cumulative = np.vstack([
+                cumulative, 
+                np.cumsum(np.insert(
+                    (f_x[:, :-1] + f_x[:, 1:]) * np.diff(x) / 2, 0, 0, axis=1
+                ), axis=1)
+            ])
+            self._cumulative = x, cumulative
+        return cumulative
+
+    def _kernel(self, given):
+        """
+        Parameters
+        ----------
+        given : (# estimated distributions x # conditional features) np.array
+
+        Returns
+        -------
+        weight : (# estimated distributions x # known distributions) np.array or scipy.sparse.csr_matrix
+            Kernel between the scaled `given` and the scaled `self.given`. 
+            Sparse if `n_neighbors` or `radius` is set.
+        """
+        if self.n_neighbors is not None or self.radius is not None:
+            return self._sparse_kernel(given)
         kwargs = {}
         if self.metric in ('poly', 'sigmoid', 'rbf', 'laplacian', 'chi2'):
             kwargs['gamma'] = self.gamma
         if self.metric in ('poly', 'sigmoid'):
             kwargs['coef0'] = self.coef0
-        weight = pairwise_kernels(
+        return pairwise_kernels(
             self.feature_scale*given, self.feature_scale*self.given, 
             metric=self.metric, **kwargs
         )
-        f_x = weight @ self.f_x
-        distributions = [Distribution(self.x, f_x_i) for f_x_i in f_x]
-        return distributions
     
-    def score(self, given, distributions):
+    def _neighbor_index(self):
+        """
+        Returns
+        -------
+        index : sklearn.neighbors.NearestNeighbors
+            Spatial index over the first `self._index_size` rows of the scaled
+            `self.given`. Built on first use and whenever `metric` or 
+            `feature_scale` have changed, or when rows appended by 
+            `partial_fit` exceed a tenth of the indexed rows.
+        """
+        if self.metric not in ('rbf', 'laplacian'):
+            raise ValueError(
+                "n_neighbors and radius require the 'rbf' or 'laplacian' "
+                "metric, got {}".format(self.metric)
+            )
+        key = (self.metric, np.asarray(self.feature_scale).tobytes())
+        if (
+            self._index is None or self._index_key != key
+            or self.given.shape[0] - self._index_size > .1*self._index_size
+        ):
+            self._index = NearestNeighbors(
+                metric='euclidean' if self.metric == 'rbf' else 'manhattan'
+            ).fit(self.feature_scale*self.given)
+            self._index_key, self._index_size = key, self.given.shape[0]
+        return self._index
+
+    def _sparse_kernel(self, given):
+        """
+        Parameters
+        ----------
+        given : (# estimated distributions x # conditional features) np.array
+
+        Returns
+        -------
+        weight : scipy.sparse.csr_matrix
+            Kernel between each scaled query and its neighbors among the 
+            scaled `self.given`; zero elsewhere.
+
+        Notes
+        -----
+        Rows appended by `partial_fit` since the index was built are 
+        searched by brute force and merged with the neighbors from the index.
+        """
+        index = self._neighbor_index()
+        query = self.feature_scale*given
+        pending = self.feature_scale*self.given[self._index_size:]
+        pending_dist = cdist(
+            query, pending, 'euclidean' if self.metric == 'rbf' else 'cityblock'
+        )
+        pending_ind = np.arange(self._index_size, self.given.shape[0])
+        if self.n_neighbors is None:
+            dist, ind = index.radius_neighbors(query, self.radius)
+            rows = np.repeat(np.arange(len(ind)), [len(i) for i in ind])
+            dist = np.concatenate(dist) if len(dist) else np.empty(0)
+            ind = np.concatenate(ind) if len(ind) else np.empty(0, dtype=int)
+            pending_rows, cols = np.nonzero(pending_dist <= self.radius)
+            rows = np.concatenate([rows, pending_rows])
+            dist = np.concatenate([dist, pending_dist[pending_rows, cols]])
+            ind = np.concatenate([ind, pending_ind[cols]])
+        else:
+            n_neighbors = min(self.n_neighbors, self.given.shape[0])
+            dist, ind = index.kneighbors(
+                query, min(n_neighbors, self._index_size)
+            )
+            if pending.shape[0]:
+                dist = np.hstack([dist, pending_dist])
+                ind = np.hstack([
+                    ind, np.broadcast_to(pending_ind, pending_dist.shape)
+                ])
+                nearest = np.argpartition(dist, n_neighbors-1, axis=1)
+                nearest = nearest[:, :n_neighbors]
+                dist = np.take_along_axis(dist, nearest, axis=1)
+                ind = np.take_along_axis(ind, nearest, axis=1)
+            if self.radius is not None:
+                # keep neighbors within the radius
+                dist = np.where(dist <= self.radius, dist, np.inf)
+            rows = np.repeat(np.arange(dist.shape[0]), n_neighbors)
+            dist, ind = dist.ravel(), ind.ravel()
+        # rbf uses squared Euclidean distance, laplacian Manhattan distance
+        data = np.exp(-self.gamma * (dist**2 if self.metric == 'rbf' else dist))
+        weight = sparse.csr_matrix(
+            (data, (rows, ind)), shape=(given.shape[0], self.given.shape[0])
+        )
+        weight.eliminate_zeros()
+        return weight
+
+    def score(
+            self, given, distributions, batch=True, max_memory=2**28, 
+            n_jobs=1, backend='threads'
+        ):
         """
         Evaluate performance.
 
@@ -172,14 +740,47 @@ class ConditionalDistribution():
         given : (# distributions x # conditional feautres) np.array
             Values of features on which to condition.
 
-        distributions : list of distribution objects
+        distributions : list of distribution objects or smoother.DistributionBatch
             Known conditional distributions against which to evaluate 
             predictions.
 
+        batch : bool, default=True
+            Indicates that the `'wasserstein'` metric is evaluated for all
+            distributions at once on the shared grid `self.x`. Otherwise, 
+            and for callable `eval_metric`s, each pair of distributions is 
+            scored separately.
+
+        max_memory, n_jobs, backend : 
+            Used by the batched path to predict and score blocks of 
+            distributions; see `predict_chunks`.
+
         Returns
         -------
         score : float
+
+        Notes
+        -----
+        The batched path evaluates the known CDFs once on `self.x` (a single
+        call per known distribution, or one call for a `DistributionBatch`) 
+        and compares them to the predicted CDF tables. Unlike `wasserstein`,
+        which spans the supports of both distributions, it ignores any 
+        probability mass of the known distributions outside `self.x`.
         """
+        if batch and self.eval_metric == 'wasserstein':
+            if isinstance(distributions, DistributionBatch):
+                true_cdf = distributions.cdf(self.x)
+            else:
+                true_cdf = np.array([dist.cdf(self.x) for dist in distributions])
+            total, start = 0, 0
+            for estimates in self.predict_chunks(
+                    given, max_memory, n_jobs, backend
+                ):
+                stop = start + len(estimates)
+                total += _wasserstein_cdf(
+                    true_cdf[start:stop], estimates.F_x, self.x
+                ).sum()
+                start = stop
+            return total / len(distributions)
         estimates = self.predict(given)
         metric = (
             metrics[self.eval_metric] if isinstance(self.eval_metric, str) 
@@ -189,6 +790,106 @@ class ConditionalDistribution():
             metric(true, estimated) for true, estimated in zip(distributions, estimates)
         ]) / len(distributions)
     
+    def search_cv(
+            self, gamma, feature_scale=None, cv=5, shuffle=True, 
+            random_state=None
+        ):
+        """
+        Cross-validated search over `gamma` and `feature_scale` for the 
+        `'rbf'` and `'laplacian'` metrics, using the data passed to `fit`.
+
+        Parameters
+        ----------
+        gamma : list of floats
+            Candidate values of `gamma`.
+
+        feature_scale : list of floats or np.arrays or None, default=None
+            Candidate values of `feature_scale`. If `None`, only the current
+            `feature_scale` is used.
+
+        cv : int, default=5
+            Number of folds.
+
+        shuffle : bool, default=True
+            Indicates that the known distributions are shuffled before they 
+            are split into folds.
+
+        random_state : None or int, default=None
+            Seed for shuffling; see `sklearn.model_selection.KFold`.
+
+        Returns
+        -------
+        self
+            With `gamma` and `feature_scale` set to the candidates with the 
+            best mean score.
+
+        Notes
+        -----
+        Sets `self.cv_results`, a dict with `'params'` (list of candidate 
+        parameter dicts), `'scores'` ((# candidates x cv) np.array of mean 
+        scores for each fold), and `'mean_score'` and `'std_score'` 
+        ((# candidates,) np.arrays).
+
+        For each fold and feature scaling, the distances between the 
+        held-out and training `given` are computed once, and the kernel for 
+        every `gamma` is derived from them. Because the conditional CDF is 
+        linear in the kernel weights, it is computed for all held-out 
+        distributions at once as a product of the kernel with the cumulative
+        integrals of the training densities. Held-out distributions are 
+        represented by their densities on `x` and scored with the 
+        `'wasserstein'` metric on `x`. Each fold takes 
+        `8 * # held-out * # training` bytes for its distance matrix. The
+        search ignores `n_neighbors` and `radius`.
+        """
+        if self.metric not in ('rbf', 'laplacian'):
+            raise ValueError(
+                "search_cv requires the 'rbf' or 'laplacian' metric, got {}"
+                .format(self.metric)
+            )
+        if self.eval_metric != 'wasserstein':
+            raise ValueError(
+                "search_cv requires eval_metric='wasserstein', got {}"
+                .format(self.eval_metric)
+            )
+        gamma = list(gamma)
+        feature_scale = (
+            [self.feature_scale] if feature_scale is None 
+            else list(feature_scale)
+        )
+        # unnormalized CDFs of the known distributions
+        C = self._cumulative_table()
+        folds = list(
+            KFold(cv, shuffle=shuffle, random_state=random_state)
+            .split(self.given)
+        )
+        distance = 'sqeuclidean' if self.metric == 'rbf' else 'cityblock'
+        scores = np.empty((len(feature_scale), len(gamma), cv))
+        for i, scale in enumerate(feature_scale):
+            given = scale * self.given
+            for k, (train, test) in enumerate(folds):
+                D = cdist(given[test], given[train], distance)
+                # the kernel's normalization cancels, so shift for stability
+                D -= D.min(axis=1, keepdims=True)
+                F_test = C[test] / C[test, -1:]
+                for j, g in enumerate(gamma):
+                    F = np.exp(-g * D) @ C[train]
+                    scores[i, j, k] = _wasserstein_cdf(
+                        F_test, F / F[:, -1:], self.x
+                    ).mean()
+        params = [
+            dict(gamma=g, feature_scale=scale) 
+            for scale in feature_scale for g in gamma
+        ]
+        scores = scores.reshape(len(params), cv)
+        mean_score = scores.mean(axis=1)
+        self.cv_results = dict(
+            params=params,
+            scores=scores,
+            mean_score=mean_score,
+            std_score=scores.std(axis=1)
+        )
+        return self.set_params(**params[int(np.nanargmax(mean_score))])
+
     def get_params(self, deep=False):
         """
         Returns
@@ -199,11 +900,14 @@ class ConditionalDistribution():
             metric=self.metric, 
             gamma=self.gamma, 
             coef0=self.coef0, 
-            feature_scale=self.feature_scale
+            feature_scale=self.feature_scale,
+            n_neighbors=self.n_neighbors,
+            radius=self.radius
         )
     
     def set_params(
-            self, metric=None, gamma=None, coef0=None, feature_scale=None
+            self, metric=None, gamma=None, coef0=None, feature_scale=None,
+            n_neighbors=None, radius=None
         ):
         """Used for cross validation"""
         if metric is not None:
@@ -214,6 +918,10 @@ class ConditionalDistribution():
             self.coef0 = coef0
         if feature_scale is not None:
             self.feature_scale = feature_scale
+        if n_neighbors is not None:
+            self.n_neighbors = n_neighbors
+        if radius is not None:
+            self.radius = radius
         return self
     
     def dump(self):
@@ -229,6 +937,8 @@ class ConditionalDistribution():
             coef0=self.coef0,
             feature_scale=self.feature_scale.tolist(),
             eval_metric=self.eval_metric,
+            n_neighbors=self.n_neighbors,
+            radius=self.radius,
             given=self.given.tolist(),
             x=self.x.tolist(),
             f_x=self.f_x.tolist()
@@ -252,9 +962,198 @@ class ConditionalDistribution():
             gamma=state['gamma'], 
             coef0=state['coef0'],
             feature_scale=state['feature_scale'],
-            eval_metric=state['eval_metric']
+            eval_metric=state['eval_metric'],
+            n_neighbors=state.get('n_neighbors'),
+            radius=state.get('radius')
         )
         dist.given = np.array(state['given'])
         dist.x = np.array(state['x'])
         dist.f_x = np.array(state['f_x'])
-        return dist
\ No newline at end of file
+        return dist
+
+    def dump_binary(self, file):
+        """
+        Writes the conditional distribution to a binary, versioned file 
+        which `load_binary` can memory-map.
+
+        Parameters
+        ----------
+        file : str, os.PathLike, or file object
+            Path or binary file object to write to.
+
+        Notes
+        -----
+        A callable `eval_metric` cannot be stored and raises a `ValueError`.
+        The file contains a header, the kernel parameters as JSON, and `x`, 
+        `given`, and `f_x` as little-endian float64 arrays. The header 
+        stores CRC-32 checksums of the parameters and of the arrays.
+        """
+        if not isinstance(self.eval_metric, str):
+            raise ValueError(
+                'A callable eval_metric cannot be stored; set eval_metric to a'
+                ' string before calling dump_binary'
+            )
+        if isinstance(file, (str, os.PathLike)):
+            with open(os.fspath(file), 'wb') as f:
+                return self.dump_binary(f)
+        params = json.dumps(dict(
+            metric=self.metric,
+            gamma=self.gamma,
+            coef0=self.coef0,
+            feature_scale=np.asarray(self.feature_scale).tolist(),
+            eval_metric=self.eval_metric,
+            n_neighbors=self.n_neighbors,
+            radius=self.radius
+        )).encode()
+        params += b' ' * (-len(params) % 8)
+        given = np.asarray(self.given, dtype='<f8').reshape(len(self.f_x), -1)
+        arrays = [
+            np.ascontiguousarray(array, dtype='<f8') 
+            for array in (self.x, given, self.f_x)
+        ]
+        data_crc = 0
+        for array in arrays:
+            data_crc = zlib.crc32(memoryview(array).cast('B'), data_crc)
+        header = np.array([(
+            _MAGIC, _VERSION, len(params), zlib.crc32(params), data_crc,
+            given.shape[0], given.shape[1], self.x.shape[0]
+        )], _HEADER)
+        file.write(header.tobytes())
+        file.write(params)
+        for array in arrays:
+            file.write(array.tobytes())
+
+    @classmethod
+    def load_binary(cls, file, mmap=True, verify=False):
+        """
+        Parameters
+        ----------
+        file : str, os.PathLike, or bytes-like
+            Path to a file written by `dump_binary`, or its contents.
+
+        mmap : bool, default=True
+            Indicates that the file should be memory-mapped. If `True`, 
+            `x`, `given`, and `f_x` are read-only views into the file, 
+            nothing is read until it is accessed, and processes which load 
+            the same file share one copy through the page cache.
+
+        verify : bool, default=False
+            Indicates that the checksum of the arrays is verified. This reads
+            the whole file. The checksum of the parameters is always 
+            verified.
+
+        Returns
+        -------
+        conditional distribution : cls
+
+        Notes
+        -----
+        Pickling a memory-mapped conditional distribution, e.g. for 
+        `predict_chunks` with `backend='processes'`, pickles the path 
+        instead of the arrays and the tables derived from them, and 
+        unpickling maps the file again.
+        """
+        if not isinstance(file, (str, os.PathLike)):
+            return cls._decode(file, verify)
+        file = os.fspath(file)
+        if not mmap:
+            with open(file, 'rb') as f:
+                return cls._decode(f.read(), verify)
+        dist = cls._decode(np.memmap(file, dtype=np.uint8, mode='r'), verify)
+        dist._store = file, dist.x, dist.given, dist.f_x
+        return dist
+
+    @classmethod
+    def _decode(cls, buffer, verify=False):
+        """
+        Parameters
+        ----------
+        buffer : bytes-like
+            Output of `dump_binary`.
+
+        verify : bool, default=False
+            See `load_binary`.
+
+        Returns
+        -------
+        conditional distribution : cls
+            Whose `x`, `given`, and `f_x` are views into `buffer`.
+        """
+        header = np.frombuffer(buffer, _HEADER, count=1)[0]
+        if header['magic'] != _MAGIC.rstrip(b'\x00'):
+            raise ValueError('Buffer is not a binary conditional distribution')
+        if header['version'] != _VERSION:
+            raise ValueError(
+                'Unsupported binary format version {}'.format(header['version'])
+            )
+        offset = _HEADER.itemsize
+        params = bytes(buffer[offset:offset+int(header['params_size'])])
+        if zlib.crc32(params) != header['params_crc']:
+            raise ValueError('Parameter checksum mismatch')
+        offset += len(params)
+        n, n_features, num = (
+            int(header['n']), int(header['n_features']), int(header['num'])
+        )
+        data = np.frombuffer(
+            buffer, '<f8', count=num + n*(n_features + num), offset=offset
+        )
+        if verify and zlib.crc32(data) != header['data_crc']:
+            raise ValueError('Data checksum mismatch')
+        state = json.loads(params)
+        feature_scale = state['feature_scale']
+        dist = cls(
+            metric=state['metric'], 
+            gamma=state['gamma'], 
+            coef0=state['coef0'],
+            feature_scale=(
+                np.array(feature_scale) if isinstance(feature_scale, list) 
+                else feature_scale
+            ),
+            eval_metric=state['eval_metric'],
+            n_neighbors=state['n_neighbors'],
+            radius=state['radius']
+        )
+        dist.x = data[:num]
+        dist.given = data[num:num+n*n_features].reshape(n, n_features)
+        dist.f_x = data[num+n*n_features:].reshape(n, num)
+        return dist
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        store = state.pop('_store', None)
+        if store is not None and all(
+                a is b for a, b in zip(store[1:], (self.x, self.given, self.f_x))
+            ):
+            # still memory-mapped; pickle the path instead of the arrays and
+            # let the tables derived from them be rebuilt
+            state['_store_path'] = store[0]
+            for key in ('x', 'given', 'f_x', '_given_buffer', '_f_x_buffer'):
+                state.pop(key, None)
+            state['_index'], state['_summary'] = None, None
+            state['_cumulative'] = None
+        return state
+
+    def __setstate__(self, state):
+        path = state.pop('_store_path', None)
+        self.__dict__.update(state)
+        if path is not None:
+            mapped = self.load_binary(path)
+            self.x, self.given, self.f_x = mapped.x, mapped.given, mapped.f_x
+            self._store = mapped._store
+            self._given_buffer, self._f_x_buffer = None, None
+
+
+_worker_estimator = None
+
+def _init_worker(estimator):
+    """
+    Stores the fitted estimator in a `predict_chunks` worker process.
+    """
+    global _worker_estimator
+    _worker_estimator = estimator
+
+def _predict_block(given):
+    """
+    Predicts a block of queries in a `predict_chunks` worker process.
+    """
+    return _worker_estimator.predict(given)
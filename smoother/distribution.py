@@ -1,8 +1,32 @@
 import numpy as np
-from scipy.stats import entropy
+from scipy.special import entr
 
+import io
 import json
-import random
+import os
+
+# binary format: header, (count+1,) record offsets, float64 data
+# each record is `x` followed by `f_x`, both little-endian float64
+_MAGIC = b'SMDIST\x00\x00'
+_VERSION = 1
+_HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('count', '<u4')])
+
+
+def trapezoid_weights(x):
+    """
+    Parameters
+    ----------
+    x : (num,) np.array
+        Sorted grid, not necessarily evenly spaced.
+
+    Returns
+    -------
+    weights : (num,) np.array
+        Weights such that `weights @ f_x` is the trapezoidal approximation 
+        of the integral of `f_x` over `x`.
+    """
+    d = np.diff(x) / 2
+    return np.append(d, 0) + np.insert(d, 0, 0)
 
 
 class Distribution():
@@ -10,14 +34,60 @@ class Distribution():
         self.x = np.linspace(0, 1) if x is None else x
         self.f_x = np.ones(self.x.shape) if f_x is None else f_x
 
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, x):
+        self._x = x
+        self._clear_cache()
+
     @property
     def f_x(self):
         return self._f_x
 
     @f_x.setter
     def f_x(self, f_x):
-        s = (f_x * (self.x[-1] - self.x[0]) / self.x.shape[0]).sum()
-        self._f_x = f_x / s
+        self._f_x = f_x / (self._w @ f_x)
+        self._clear_cache()
+
+    def _clear_cache(self):
+        """
+        Clears tables derived from `self.x` and `self._f_x`, such as 
+        `self.F_x` and moments. This must be called whenever `self._f_x` is 
+        reassigned without going through the `f_x` setter.
+        """
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        """
+        Parameters
+        ----------
+        key : hashable
+            Name of the derived table.
+
+        compute : callable
+            Computes the table if it is not already cached.
+
+        Returns
+        -------
+        table : 
+            Cached output of `compute`.
+        """
+        if not hasattr(self, '_cache'):
+            self._cache = {}
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def _w(self):
+        """
+        Trapezoidal integration weights for `self.x`; see 
+        `trapezoid_weights`.
+        """
+        return self._cached('w', lambda: trapezoid_weights(self.x))
     
     @property
     def F_x(self):
@@ -27,31 +97,40 @@ class Distribution():
         F_x[1] = integral_0^d f_x[0] + (f_x[1]-f_x[0])/d * x dx
         = [f_x[0]*x + (f_x[1]-f_x[0])/d * x^2]_0^d
         = 1/2 * (f_x[0] + f_x[1]) * d
-        This is f_x[:-1] + f_x[1:]
-        We normalize in the end, so we can leave off 1/2 and d.
+        This is (f_x[:-1] + f_x[1:]) * np.diff(x)
+        We normalize in the end, so we can leave off 1/2.
 
         F_x[0] = 0
         This is np.insert(f_x, 0, 0)
         """
-        f_x = np.insert(self._f_x[:-1] + self._f_x[1:], 0, 0)
-        a = np.cumsum(f_x)
-        return a / a[-1]
+        def compute():
+            f_x = (self._f_x[:-1] + self._f_x[1:]) * np.diff(self.x)
+            a = np.cumsum(np.insert(f_x, 0, 0))
+            return a / a[-1]
+
+        return self._cached('F_x', compute)
 
-    def rvs(self, size=1):
+    def rvs(self, size=1, random_state=None):
         """
         Parameters
         ----------
-        size : int, default=1
-            Size of the output vector.
+        size : int or tuple of ints, default=1
+            Size of the output array.
+
+        random_state : None, int, np.random.SeedSequence, or np.random.Generator, default=None
+            Seed or generator passed to `np.random.default_rng`. Pass a 
+            `Generator` or `SeedSequence` spawned per worker to get 
+            independent, reproducible streams.
 
         Returns
         -------
         sample : np.array or scalar
-            Vector of random samples from the distribution. If `size` is 1,
+            Array of random samples from the distribution. If `size` is 1,
             return a scalar.
         """
-        x = [self.ppf(random.random()) for _ in range(size)]
-        return x[0] if size == 1 else np.array(x)
+        rng = np.random.default_rng(random_state)
+        x = self._ppf(rng.random(size))
+        return x[0] if size == 1 else x
     
     def mean(self):
         """
@@ -90,139 +169,153 @@ class Distribution():
         Returns
         -------
         entropy : float
+            Differential entropy, integrated over `self.x` with the 
+            trapezoidal rule.
         """
-        return entropy(self._f_x)
+        mass = self._w @ self._f_x
+        return self._w @ entr(self._f_x / mass)
     
     def pdf(self, x):
         """
         Parameters
         ----------
-        x : float
+        x : float, list, or np.array
 
         Returns
         -------
-        pdf(x) : float
+        pdf(x) : float, list, or np.array
             Probability density function of `x`.
         """
-        def pdf(x):
-            if x < self.x[0] or self.x[-1] < x:
-                return 0
-            lb, w_lb, ub, w_ub = self._get_weights(x)
-            return w_lb * self.f_x[lb] + w_ub * self.f_x[ub]
-
-        if isinstance(x, (int, float)):
-            return pdf(x)
-        if isinstance(x, list):
-            return [pdf(x_i) for x_i in x]
-        if isinstance(x, np.ndarray):
-            return np.array([pdf(x_i) for x_i in x])
+        return self._format(x, self._interp(x, self._f_x, 0, 0))
     
     def cdf(self, x):
         """
         Parameters
         ----------
-        x : float
+        x : float, list, or np.array
 
         Returns
         -------
-        cdf(x) : float between 0. and 1.
+        cdf(x) : float between 0. and 1., list, or np.array
             Cumulative distribution function of `x`.
         """
-        def cdf(x):
-            if x <= self.x[0]:
-                return 0
-            if self.x[-1] <= x:
-                return 1
-            lb, w_lb, ub, w_ub = self._get_weights(x)
-            return w_lb * self.F_x[lb] + w_ub * self.F_x[ub]
+        return self._format(x, self._interp(x, self.F_x, 0, 1))
 
-        if isinstance(x, (int, float)):
-            return cdf(x)
-        if isinstance(x, list):
-            return [cdf(x_i) for x_i in x]
-        if isinstance(x, np.ndarray):
-            return np.array([cdf(x_i) for x_i in x])
-        
-    def _get_weights(self, x):
+    def _interp(self, x, y, left, right):
         """
-        Computes the indices and weights of points on either side of `x`.
+        Linearly interpolates `y`, defined on `self.x`, at the points `x`.
+
+        Parameters
+        ----------
+        x : scalar or array-like
+            Points at which to interpolate.
+
+        y : np.array
+            Values on the grid `self.x`; e.g. `self.f_x` or `self.F_x`.
+
+        left, right : scalar
+            Values returned for points below `self.x[0]` or above 
+            `self.x[-1]`.
 
         Returns
         -------
-        lb, w_lb, ub, w_ub : int, float, int, float
-            Index of the 'lower bound', weight on the lower bound, index of 
-            the 'upper bound', weight on the upper bound. The weights on the 
-            boundary points are based on the linear distance of the points 
-            from `x`.
-        """
-        # lb = arg max_i {self.x[i] : self.x[i] < x}
-        # ub = arg min_i {self.x[i] : self.x[i] > x}
-        lb, ub  = np.where(self.x<=x)[0][-1], np.where(self.x>=x)[0][0]
-        delta = self.x[ub] - self.x[lb]
-        return (
-            (lb, .5, ub, .5) if delta == 0 
-            else (lb, 1 - (x-self.x[lb])/delta, ub, 1 - (self.x[ub]-x)/delta)
+        y(x) : np.array
+        """
+        x = np.asarray(x, dtype=float)
+        # ub = arg min_i {self.x[i] : self.x[i] > x}, clipped to the grid
+        ub = np.clip(
+            np.searchsorted(self.x, x, side='right'), 1, self.x.shape[0]-1
         )
+        lb = ub - 1
+        x_lb, x_ub = self.x[lb], self.x[ub]
+        w_ub = (x - x_lb) / (x_ub - x_lb)
+        y_x = y[lb] + w_ub * (y[ub] - y[lb])
+        y_x = np.where(x < self.x[0], left, y_x)
+        return np.where(self.x[-1] < x, right, y_x)
+
+    @staticmethod
+    def _format(x, y_x):
+        """
+        Returns `y_x` in the same container type as the query `x`; a list for 
+        a list, an array for an array, and a float for a scalar.
+        """
+        if isinstance(x, list):
+            return y_x.tolist()
+        if isinstance(x, np.ndarray):
+            return y_x
+        return float(y_x)
     
     def ppf(self, q):
         """
         Parameters
         ----------
-        q : float between 0. and 1.
+        q : float between 0. and 1., list, or np.array
             Quantile.
 
         Returns
         -------
-        ppf(q) : float
+        ppf(q) : float, list, or np.array
             Percent point function; inverse of `self.cdf`.
+
+        Notes
+        -----
+        `self.cdf` is piecewise linear between the points in `self.x`, so 
+        the inverse is computed exactly by locating the segment containing 
+        each quantile and solving for `x` within that segment.
+        """
+        return self._format(q, self._ppf(q))
+
+    def _ppf(self, q):
         """
-        def ppf(q):
-            def get_ppf(x, i, max_iter=1e2):
-                delta = self.cdf(x) - q
-                if abs(delta) < 1e-4 or i > max_iter:
-                    return x
-                step_size = (self.x[-1] - self.x[0]) / 2**(i+1)
-                x += step_size if delta < 0 else -step_size
-                return get_ppf(x, i+1)
-
-            if q == 0:
-                return self.x[0]
-            if q == 1:
-                return self.x[-1]
-            return get_ppf((self.x[0] + self.x[-1])/2, 0)
-
-        if isinstance(q, (int, float)):
-            return ppf(q)
-        if isinstance(q, list):
-            return [ppf(q_i) for q_i in q]
-        if isinstance(q, np.ndarray):
-            return np.array([ppf(q_i) for q_i in q])
+        Vectorized percent point function.
+
+        Parameters
+        ----------
+        q : scalar or array-like
+
+        Returns
+        -------
+        ppf(q) : np.array
+        """
+        q = np.asarray(q, dtype=float)
+        F_x = self.F_x
+        # ub = arg min_i {F_x[i] : F_x[i] >= q}, clipped to the grid
+        ub = np.clip(
+            np.searchsorted(F_x, q, side='left'), 1, self.x.shape[0]-1
+        )
+        lb = ub - 1
+        x_lb, x_ub = self.x[lb], self.x[ub]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w_ub = (q - F_x[lb]) / (F_x[ub] - F_x[lb])
+        x = x_lb + w_ub * (x_ub - x_lb)
+        x = np.where(q <= 0, self.x[0], x)
+        return np.where(1 <= q, self.x[-1], x)
     
     def sf(self, x):
         """
         Parameters
         ----------
-        x : float
+        x : float, list, or np.array
 
         Returns
         -------
-        sf(x) : float between 0. and 1.
+        sf(x) : float between 0. and 1., list, or np.array
             Survival function; `1-self.cdf`.
         """
-        return 1-self.cdf(x)
+        return self._format(x, 1-self._interp(x, self.F_x, 0, 1))
     
     def isf(self, q):
         """
         Parameters
         ----------
-        q : float between 0. and 1.
+        q : float between 0. and 1., list, or np.array
 
         Returns
         -------
-        isf(x) : float
+        isf(x) : float, list, or np.array
             Inverse survival function.
         """
-        return self.ppf(1-q)
+        return self._format(q, self._ppf(1-np.asarray(q, dtype=float)))
     
     def moment(self, degree=1, type_='raw', norm=False):
         """
@@ -239,15 +332,119 @@ class Distribution():
         Returns
         -------
         moment : float
+
+        Notes
+        -----
+        Moments are cached until `f_x` changes.
+        """
+        return self._cached(
+            ('moment', degree, type_, norm),
+            lambda: float(self.moments([degree], type_, norm)[0])
+        )
+
+    def moments(self, degrees, type_='raw', norm=False):
         """
+        Computes several moments in one vectorized pass over the grid.
+
+        Parameters
+        ----------
+        degrees : list of ints or np.array
+            Degrees of the moments.
+        type_ : str, default='raw'
+            Type of moment; `'raw'`, `'central'`, or `'standardized'`.
+        norm : bool, default=False
+            Indicates whether to return the norms of the moments. If `True`, 
+            return `moment**(1/degree)` for each degree.
+
+        Returns
+        -------
+        moments : np.array
+            Moments in the same order as `degrees`.
+        """
+        degrees = np.asarray(degrees)
         if type_ == 'raw':
             val = self.x
         elif type_ == 'central':
             val = self.x - self.mean()
         elif type_ == 'standardized':
             val = (self.x - self.mean()) / self.std()
-        val = (val**degree * self._f_x).mean()
-        return val**(1/degree) if norm else val
+        else:
+            raise ValueError(
+                "type_ must be 'raw', 'central', or 'standardized', got {}"
+                .format(type_)
+            )
+        w_f_x = self._w * self._f_x
+        vals = val**degrees.reshape(-1, 1) @ w_f_x / w_f_x.sum()
+        return vals**(1/degrees) if norm else vals
+
+    def _cdf_weights(self, x):
+        """
+        Parameters
+        ----------
+        x : float
+
+        Returns
+        -------
+        weights : (num,) np.array
+            Weights such that `self.cdf(x)` equals 
+            `weights @ self._f_x / (self._w @ self._f_x)`. Used for analytic 
+            gradients and linear constraints.
+        """
+        weights = np.zeros(self.x.shape[0])
+        if x <= self.x[0]:
+            return weights
+        if self.x[-1] <= x:
+            return self._w.copy()
+        # integral up to x[k] has the trapezoid weights of the grid up to x[k]
+        k = np.searchsorted(self.x, x, side='right') - 1
+        alpha = (x - self.x[k]) / (self.x[k+1] - self.x[k])
+        weights[:k+1] = (1-alpha) * trapezoid_weights(self.x[:k+1])
+        weights[:k+2] += alpha * trapezoid_weights(self.x[:k+2])
+        return weights
+
+    def _moment_gradient(self, degree=1, type_='raw', norm=False):
+        """
+        Parameters
+        ----------
+        degree, type_, norm : 
+            See `self.moment`.
+
+        Returns
+        -------
+        gradient : (num,) np.array
+            Gradient of `self.moment(degree, type_, norm)` with respect to 
+            `self._f_x`.
+        """
+        w, mass = self._w, self._w @ self._f_x
+
+        def central_gradient(degree):
+            # derivative through the mean: -degree * c_{degree-1} * dmean/df
+            val = self.x - self.mean()
+            c = self.moment(degree, 'central')
+            c_lower = self.moment(degree-1, 'central') if degree > 1 else 1
+            return w * (val**degree - c - degree * c_lower * val) / mass
+
+        if type_ == 'raw':
+            moment = self.moment(degree)
+            gradient = w * (self.x**degree - moment) / mass
+        elif type_ == 'central':
+            moment = self.moment(degree, 'central')
+            gradient = central_gradient(degree)
+        elif type_ == 'standardized':
+            moment = self.moment(degree, 'standardized')
+            std = self.std()
+            gradient = (
+                central_gradient(degree) / std**degree
+                - degree * moment / std * central_gradient(2) / (2 * std)
+            )
+        else:
+            raise ValueError(
+                "type_ must be 'raw', 'central', or 'standardized', got {}"
+                .format(type_)
+            )
+        if norm:
+            gradient = moment**(1/degree - 1) / degree * gradient
+        return gradient
 
     def dump(self):
         """
@@ -279,4 +476,113 @@ class Distribution():
             np.array(state_dict['x']), 
             np.array(state_dict['f_x'])
         )
-        return instance
\ No newline at end of file
+        return instance
+
+    def dump_binary(self):
+        """
+        Returns
+        -------
+        buffer : bytes
+            Binary dump of `x` and `f_x` as little-endian float64. Unlike 
+            `self.dump`, this round-trips exactly.
+        """
+        file = io.BytesIO()
+        self.dump_many([self], file)
+        return file.getvalue()
+
+    @classmethod
+    def load_binary(cls, buffer):
+        """
+        Parameters
+        ----------
+        buffer : bytes-like
+            Output of `self.dump_binary`.
+
+        Returns
+        -------
+        distribution : cls
+            Distribution whose `x` and `f_x` are views into `buffer`.
+        """
+        return cls._decode(buffer)[0]
+
+    @staticmethod
+    def dump_many(distributions, file):
+        """
+        Writes many distributions to a single binary file.
+
+        Parameters
+        ----------
+        distributions : list of `Distribution`s
+
+        file : str, os.PathLike, or file object
+            Path or binary file object to write to.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(os.fspath(file), 'wb') as f:
+                return Distribution.dump_many(distributions, f)
+        sizes = [2*dist.x.shape[0] for dist in distributions]
+        header = np.array([(_MAGIC, _VERSION, len(distributions))], _HEADER)
+        file.write(header.tobytes())
+        file.write(np.cumsum([0]+sizes, dtype='<u8').tobytes())
+        for dist in distributions:
+            file.write(np.asarray(dist.x, dtype='<f8').tobytes())
+            file.write(np.asarray(dist._f_x, dtype='<f8').tobytes())
+
+    @classmethod
+    def load_many(cls, file, mmap=True):
+        """
+        Parameters
+        ----------
+        file : str or os.PathLike
+            Path to a file written by `Distribution.dump_many`.
+
+        mmap : bool, default=True
+            Indicates that the file should be memory-mapped. If `True`, the 
+            returned distributions are read-only views into the file and 
+            nothing is copied into memory until it is accessed.
+
+        Returns
+        -------
+        distributions : list of cls
+        """
+        if mmap:
+            return cls._decode(np.memmap(file, dtype=np.uint8, mode='r'))
+        with open(file, 'rb') as f:
+            return cls._decode(f.read())
+
+    @classmethod
+    def _decode(cls, buffer):
+        """
+        Parameters
+        ----------
+        buffer : bytes-like
+            Binary dump in the format written by `Distribution.dump_many`.
+
+        Returns
+        -------
+        distributions : list of cls
+            Distributions whose `x` and `f_x` are views into `buffer`.
+        """
+        header = np.frombuffer(buffer, _HEADER, count=1)[0]
+        if header['magic'] != _MAGIC.rstrip(b'\x00'):
+            raise ValueError('Buffer is not a binary distribution dump')
+        if header['version'] != _VERSION:
+            raise ValueError(
+                'Unsupported binary format version {}'.format(header['version'])
+            )
+        count = int(header['count'])
+        offsets = np.frombuffer(
+            buffer, '<u8', count=count+1, offset=_HEADER.itemsize
+        )
+        data = np.frombuffer(
+            buffer, '<f8', count=int(offsets[-1]), 
+            offset=_HEADER.itemsize + offsets.nbytes
+        )
+        distributions = []
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            record = data[start:stop]
+            dist = cls.__new__(cls)
+            dist.x, dist._f_x = np.split(record, 2)
+            dist._clear_cache()
+            distributions.append(dist)
+        return distributions
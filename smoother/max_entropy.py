@@ -1,18 +1,136 @@
 """# Maximum entropy distribution"""
 
+from .batch import DistributionBatch
+from .distribution import trapezoid_weights
 from .smoother import Smoother
 
 import numpy as np
-from scipy.optimize import minimize
-from scipy.integrate import quad
+from scipy.optimize import OptimizeResult
+
+import hashlib
+import time
+from collections import OrderedDict
+
+
+def _dual_newton(
+        features, w, values, params, tol=1e-10, max_iter=100, callback=None
+    ):
+    """
+    Solves the maximum entropy dual problems
+
+    min_params log(w @ exp(params @ features)) - params @ values
+
+    for many target vectors at once with a damped Newton method. The gradient
+    is the difference between the moments of the current density and the
+    targets, and the Hessian is the covariance of the features under the
+    current density.
+
+    Parameters
+    ----------
+    features : (k x num) np.array
+        Moment functions evaluated on the grid.
+
+    w : (num,) np.array
+        Trapezoidal integration weights for the grid.
+
+    values : (m x k) np.array
+        Target values of the moment functions.
+
+    params : (m x k) np.array
+        Initial dual parameters.
+
+    tol : float, default=1e-10
+        Tolerance for the largest absolute moment residual.
+
+    max_iter : int, default=100
+        Maximum number of Newton steps.
+
+    callback : callable or None, default=None
+        Called with the (m x k) dual parameters and the number of dual 
+        objective evaluations so far after each Newton step.
+
+    Returns
+    -------
+    params : (m x k) np.array
+        Dual parameters.
+
+    converged : (m,) np.array of bools
+        Indicates that each problem converged.
+
+    nit, nfev : int, int
+        Number of Newton steps and dual objective evaluations.
+    """
+    def evaluate(params, values):
+        # log-sum-exp keeps the partition function finite
+        a = params @ features
+        a_max = a.max(axis=1, keepdims=True)
+        p = w * np.exp(a - a_max)
+        Z = p.sum(axis=1, keepdims=True)
+        loss = np.log(Z[:, 0]) + a_max[:, 0] - (params * values).sum(axis=1)
+        return loss, p / Z
+
+    params = np.array(params, dtype=float)
+    values = np.asarray(values, dtype=float)
+    converged = np.zeros(params.shape[0], dtype=bool)
+    # only problems which have not converged are updated
+    active = np.arange(params.shape[0])
+    loss, p = evaluate(params, values)
+    nit, nfev = 0, 1
+    while True:
+        mean = p @ features.T
+        grad = mean - values[active]
+        done = abs(grad).max(axis=1, initial=0) <= tol
+        converged[active[done]] = True
+        if done.all() or nit >= max_iter:
+            break
+        active, loss, p = active[~done], loss[~done], p[~done]
+        mean, grad = mean[~done], grad[~done]
+        cov = np.einsum('mn,kn,jn->mkj', p, features, features)
+        cov -= mean[:, :, None] * mean[:, None, :]
+        # a small ridge keeps the Newton system solvable for redundant features
+        cov += 1e-12 * np.eye(features.shape[0]) * (
+            1 + np.trace(cov, axis1=1, axis2=2)[:, None, None]
+        )
+        step = -np.linalg.solve(cov, grad[:, :, None])[:, :, 0]
+        slope = (grad * step).sum(axis=1)
+        t = np.ones(active.shape[0])
+        while True:
+            new_loss, new_p = evaluate(
+                params[active] + t[:, None] * step, values[active]
+            )
+            nfev += 1
+            # near the optimum, changes in the loss are lost to rounding
+            accept = (
+                new_loss <= loss + 1e-4 * t * slope + 1e-14 * (1 + abs(loss))
+            ) | (t < 1e-10)
+            if accept.all():
+                break
+            t[~accept] /= 2
+        params[active] += t[:, None] * step
+        loss, p = new_loss, new_p
+        nit += 1
+        if callback is not None:
+            callback(params, nfev)
+    return params, converged, nit, nfev
 
 
 class MaxEntropy(Smoother):
     """
-    Computes a maximum entropy distribution given moment constraints. Inherits 
-    from `Smoother`. The only difference is that the `fit` method is optimized 
+    Computes a maximum entropy distribution given moment constraints. Inherits
+    from `Smoother`. The only difference is that the `fit` method is optimized
     but more restrictive.
 
+    Parameters
+    ----------
+    x, f_x : np.array or None, default=None
+        See `Distribution`.
+
+    cache_size : int, default=0
+        Maximum number of solved dual parameter vectors kept between fits. 
+        If positive, each fit starts from the cached solution with the same
+        bounds, grid, and moment functions whose targets are nearest to the
+        new targets, and the least recently used solutions are evicted. 
+
     Examples
     --------
     This example approximates a standard normal distribution.
@@ -27,13 +145,49 @@ class MaxEntropy(Smoother):
     plt.plot(dist.x, dist.f_x)
     ```
 
+    Fit many target vectors for the same moment functions at once.
+
+    ```python
+    import numpy as np
+
+    values = np.column_stack([np.linspace(-1, 1, 1000), np.ones(1000)])
+    batch = MaxEntropy().fit_batch(
+        -3, 3, [lambda x: x, lambda x: x**2], values
+    )
+    batch.mean() # (1000,) array
+    ```
+
+    Warm start repeated fits from a cache of solutions.
+
+    ```python
+    dist = MaxEntropy(cache_size=100)
+    for mean in np.linspace(-1, 1, 1000):
+        dist.fit(-3, 3, [lambda x: x, lambda x: x**2], [mean, 1+mean**2])
+    dist.cache_info() # {'hits': 999, 'misses': 1, ...}
+    ```
+
     Notes
     -----
-    See 
+    See
     <https://en.wikipedia.org/wiki/Maximum_entropy_probability_distribution#Continuous_case>
     for mathematical detail.
+
+    The dual problem is solved on the grid `self.x`. The moment functions are
+    evaluated once into a feature matrix, and the partition function, its
+    gradient (the moment residuals), and its Hessian (the covariance of the
+    moment functions) are computed in closed form for Newton's method. The
+    moments of the fitted distribution therefore match `values` exactly
+    under the trapezoidal rule used by `Distribution.moment`.
     """
-    def fit(self, lb, ub, moment_funcs, values, num=50):
+    def __init__(self, x=None, f_x=None, cache_size=0):
+        super().__init__(x, f_x)
+        self.cache_size = cache_size
+        self.clear_dual_cache()
+
+    def fit(
+            self, lb, ub, moment_funcs, values, num=50, callback=None,
+            tol=1e-10, max_iter=100
+        ):
         """
         Parameters
         ----------
@@ -47,32 +201,334 @@ class MaxEntropy(Smoother):
             List of moment functions. e.g. for the mean, use `lambda x: x`.
 
         values : list of scalars
-            List of values the expected value of the moment functions should 
+            List of values the expected value of the moment functions should
             evaluate to.
 
         num : int, default=50
             Number of points on the distribution used for approximation.
 
+        callback : callable or None, default=None
+            Called with the distribution after each Newton step, with `f_x`
+            set to the density implied by the current dual parameters. If it
+            returns `True`, the fit stops early.
+
+        tol : float, default=1e-10
+            Tolerance for the largest absolute difference between the
+            expected values of the moment functions and `values`.
+
+        max_iter : int, default=100
+            Maximum number of Newton steps.
+
         Returns
         -------
         self
+
+        Notes
+        -----
+        Sets `self.diagnostics`; see `Smoother`. The moment functions are
+        evaluated together, so there are no per-constraint statistics.
         """
+        start = time.perf_counter()
         self.x = np.linspace(lb, ub, num)
-        self._moment_funcs = moment_funcs + [lambda x: 1]
-        self._values = values + [1]
-        res = minimize(self._loss, [0]*(len(moment_funcs)+1))
-        self._f_x = (ub - lb) * self._pdf(self.x, res.x)
-        del self._moment_funcs, self._values
+        features = self._features(self.x, moment_funcs)
+        values = np.asarray(values, dtype=float).reshape(1, -1)
+        key = self._dual_cache_key(lb, ub, features)
+        params0 = self._warm_start(key, values)
+        status, message = 0, 'Optimization terminated successfully'
+        self._callback, self._feature_matrix = callback, features
+        self._nit, self._nfev, self._params = 0, 0, params0
+        try:
+            params, converged, nit, nfev = _dual_newton(
+                features, self._w, values, params0, tol, max_iter,
+                self._iteration_callback if callback else None
+            )
+            if not converged.all():
+                status, message = 1, 'Iteration limit reached'
+            self._store_dual(key, values, params, converged)
+        except StopIteration:
+            params, nit, nfev = self._params, self._nit, self._nfev
+            status, message = 99, 'Stopped by callback'
+        self.f_x = self._pdf(features, params[0])
+        res = OptimizeResult(
+            x=params[0], success=status == 0, status=status, message=message,
+            nit=nit, nfev=nfev, njev=nit
+        )
+        self.diagnostics = dict(
+            success=bool(res.success),
+            status=res.status,
+            message=res.message,
+            nit=res.nit,
+            nfev=res.nfev,
+            njev=res.njev,
+            time=time.perf_counter() - start,
+            results=[res]
+        )
+        del self._callback, self._feature_matrix, self._nit, self._nfev
+        del self._params
         return self
-        
-    def _pdf(self, x, params):
-        return np.exp(
-            sum([param*f(x) for param, f in zip(params, self._moment_funcs)])
+
+    def fit_batch(
+            self, lb, ub, moment_funcs, values, num=50, tol=1e-10,
+            max_iter=100, chunksize=None
+        ):
+        """
+        Fits one maximum entropy distribution for each row of `values`.
+        Each row counts as one cache hit or miss.
+
+        Parameters
+        ----------
+        lb : scalar
+            Lower bound of the distributions.
+
+        ub : scalar
+            Upper bound of the distributions.
+
+        moment_funcs : list of callable
+            List of `k` moment functions shared by all problems.
+
+        values : (m x k) array-like
+            Each row holds the values the expected value of the moment
+            functions should evaluate to for one distribution.
+
+        num : int, default=50
+            Number of points on the shared grid.
+
+        tol : float, default=1e-10
+            See `fit`.
+
+        max_iter : int, default=100
+            See `fit`.
+
+        chunksize : int or None, default=None
+            Number of problems solved together. The Newton systems for a
+            chunk take `chunksize * k**2` floats, and the densities take
+            `chunksize * num`. If `None`, all problems are solved together.
+
+        Returns
+        -------
+        batch : `DistributionBatch`
+            Fitted distributions on the grid `np.linspace(lb, ub, num)`, in
+            the same order as `values`.
+
+        Notes
+        -----
+        The moment functions are evaluated once, and the dual problems are
+        solved with a single vectorized Newton iteration (see `fit`). The
+        estimator itself is not refit; `self.diagnostics` is set as in `fit`,
+        except that `'success'` is `True` only if every problem converged, 
+        `'converged'` is an (m,) array of bools, and `'results'` is empty.
+        """
+        start = time.perf_counter()
+        x = np.linspace(lb, ub, num)
+        features = self._features(x, moment_funcs)
+        w = trapezoid_weights(x)
+        values = np.asarray(values, dtype=float).reshape(
+            -1, features.shape[0]
         )
-    
-    def _loss(self, params):
-        constraint_loss = sum(
-            [param*val for param, val in zip(params, self._values)]
+        chunksize = chunksize or max(values.shape[0], 1)
+        key = self._dual_cache_key(lb, ub, features)
+        params = self._warm_start(key, values)
+        converged = np.ones(values.shape[0], dtype=bool)
+        nit = nfev = 0
+        for i in range(0, values.shape[0], chunksize):
+            chunk = slice(i, i+chunksize)
+            params[chunk], converged[chunk], chunk_nit, chunk_nfev = (
+                _dual_newton(
+                    features, w, values[chunk], params[chunk], tol, max_iter
+                )
+            )
+            nit, nfev = nit + chunk_nit, nfev + chunk_nfev
+        self._store_dual(key, values, params, converged)
+        success = bool(converged.all())
+        self.diagnostics = dict(
+            success=success,
+            status=0 if success else 1,
+            message=(
+                'Optimization terminated successfully' if success
+                else 'Iteration limit reached'
+            ),
+            nit=nit,
+            nfev=nfev,
+            njev=nit,
+            time=time.perf_counter() - start,
+            converged=converged,
+            results=[]
         )
-        integral = quad(self._pdf, self.x[0], self.x[-1], params)[0]
-        return integral - constraint_loss
\ No newline at end of file
+        a = params @ features
+        return DistributionBatch(x, np.exp(a - a.max(axis=1, keepdims=True)))
+
+    def cache_info(self):
+        """
+        Returns
+        -------
+        info : dict
+            `'hits'`: number of fits warm started from a cached solution. 
+            `'misses'`: number of fits started from zero. `'maxsize'`: 
+            `self.cache_size`. `'currsize'`: number of cached solutions.
+        """
+        self._check_dual_cache()
+        return dict(
+            hits=self._cache_hits,
+            misses=self._cache_misses,
+            maxsize=self.cache_size,
+            currsize=len(self._dual_cache)
+        )
+
+    def clear_dual_cache(self):
+        """
+        Clears the cache of dual parameters and resets the hit and miss 
+        counts.
+        """
+        self._dual_cache = OrderedDict()
+        self._cache_hits = self._cache_misses = 0
+
+    def _check_dual_cache(self):
+        """
+        Creates the dual cache for instances made without `__init__`, e.g. by
+        `Distribution.load_many`.
+        """
+        if not hasattr(self, '_dual_cache'):
+            self.cache_size = getattr(self, 'cache_size', 0)
+            self.clear_dual_cache()
+
+    @staticmethod
+    def _dual_cache_key(lb, ub, features):
+        """
+        Parameters
+        ----------
+        lb, ub : scalar
+            Bounds of the grid.
+
+        features : (k x num) np.array
+            Moment functions evaluated on the grid.
+
+        Returns
+        -------
+        key : tuple
+            Identifies the bounds, grid, and moment functions of a problem.
+        """
+        return (
+            float(lb), float(ub), features.shape,
+            hashlib.sha1(np.ascontiguousarray(features).tobytes()).hexdigest()
+        )
+
+    def _warm_start(self, key, values):
+        """
+        Parameters
+        ----------
+        key : tuple
+            Output of `self._dual_cache_key`.
+
+        values : (m x k) np.array
+            Targets.
+
+        Returns
+        -------
+        params : (m x k) np.array
+            For each row of `values`, the cached dual parameters for `key` 
+            whose targets are nearest, or zeros if there are none.
+        """
+        self._check_dual_cache()
+        params = np.zeros(values.shape)
+        entries = [
+            (cache_key, entry) for cache_key, entry in self._dual_cache.items()
+            if cache_key[0] == key
+        ]
+        if not self.cache_size or not entries:
+            self._cache_misses += values.shape[0]
+            return params
+        cached_values = np.array([entry[0] for _, entry in entries])
+        cached_params = np.array([entry[1] for _, entry in entries])
+        dist = (
+            (values**2).sum(axis=1, keepdims=True)
+            - 2 * values @ cached_values.T
+            + (cached_values**2).sum(axis=1)
+        )
+        nearest = dist.argmin(axis=1)
+        for i in np.unique(nearest):
+            self._dual_cache.move_to_end(entries[i][0])
+        self._cache_hits += values.shape[0]
+        return cached_params[nearest]
+
+    def _store_dual(self, key, values, params, converged):
+        """
+        Caches the dual parameters of converged problems, evicting the least
+        recently used solutions beyond `self.cache_size`.
+
+        Parameters
+        ----------
+        key : tuple
+            Output of `self._dual_cache_key`.
+
+        values, params : (m x k) np.array
+            Targets and solved dual parameters.
+
+        converged : (m,) np.array of bools
+        """
+        if not self.cache_size:
+            return
+        start = max(values.shape[0] - self.cache_size, 0)
+        for value, param in zip(
+                values[start:][converged[start:]],
+                params[start:][converged[start:]]
+            ):
+            cache_key = (key, value.tobytes())
+            self._dual_cache[cache_key] = (value.copy(), param.copy())
+            self._dual_cache.move_to_end(cache_key)
+        while len(self._dual_cache) > self.cache_size:
+            self._dual_cache.popitem(last=False)
+
+    @staticmethod
+    def _features(x, moment_funcs):
+        """
+        Parameters
+        ----------
+        x : (num,) np.array
+            Grid.
+
+        moment_funcs : list of callable
+
+        Returns
+        -------
+        features : (# moment functions x num) np.array
+            Moment functions evaluated on `x`.
+        """
+        return np.array([
+            np.broadcast_to(f(x), x.shape) for f in moment_funcs
+        ], dtype=float).reshape(-1, x.shape[0])
+
+    @staticmethod
+    def _pdf(features, params):
+        """
+        Parameters
+        ----------
+        features : (k x num) np.array
+
+        params : (k,) np.array
+            Dual parameters.
+
+        Returns
+        -------
+        f_x : (num,) np.array
+            Unnormalized density on the grid.
+        """
+        a = params @ features
+        return np.exp(a - a.max())
+
+    def _iteration_callback(self, params, nfev):
+        """
+        Wraps the user callback for `_dual_newton`.
+
+        Parameters
+        ----------
+        params : (1 x k) np.array
+            Current dual parameters.
+
+        nfev : int
+            Number of dual objective evaluations so far.
+        """
+        self._nit, self._nfev = self._nit + 1, nfev
+        self._params = params.copy()
+        self.f_x = self._pdf(self._feature_matrix, params[0])
+        if self._callback(self):
+            raise StopIteration
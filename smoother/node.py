@@ -111,8 +111,7 @@ class Node():
         assert self.distribution is not None
         if self.in_nodes:
             given = self.given_rvs(size)
-            conditional_dists = self.distribution.predict(given)
-            self.frozen_rvs = np.array([d.rvs() for d in conditional_dists])
+            self.frozen_rvs = self.distribution.predict(given).rvs()
         else:
             self.frozen_rvs = self.distribution.rvs(size)
         return self.frozen_rvs
@@ -0,0 +1,173 @@
+"""# Parallel fitting
+
+`fit_many` fits many independent `Smoother` and `MaxEntropy` problems across
+a process pool.
+
+Examples
+--------
+```python
+from smoother import MaxEntropy, MomentConstraint, Smoother, fit_many
+
+problems = [
+    (Smoother(), (-3, 3, [MomentConstraint(mean, degree=1)]))
+    for mean in (-1, 0, 1)
+] + [(MaxEntropy(), (-3, 3, [lambda x: x], [0]))]
+fitted = fit_many(problems, n_jobs=2)
+```
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import math
+import os
+import pickle
+import traceback
+
+
+class FitError(Exception):
+    """
+    Returned by `fit_many` in place of a fitted object when a fit fails.
+
+    Parameters and attributes
+    -------------------------
+    index : int
+        Index of the failed problem.
+
+    message : str
+        Formatted traceback of the error raised during the fit.
+    """
+    def __init__(self, index, message):
+        super().__init__(index, message)
+        self.index = index
+        self.message = message
+
+    def __str__(self):
+        return 'Problem {} failed:\n{}'.format(self.index, self.message)
+
+
+def fit_many(problems, n_jobs=None, chunksize=None):
+    """
+    Fits many independent problems in parallel.
+
+    Parameters
+    ----------
+    problems : list of tuples
+        Each problem is `(estimator, args)` or `(estimator, args, kwargs)`,
+        and is fit with `estimator.fit(*args, **kwargs)`.
+
+    n_jobs : int or None, default=None
+        Number of worker processes. `None` or `-1` uses all CPUs. `1` fits
+        every problem serially in this process.
+
+    chunksize : int or None, default=None
+        Number of problems sent to a worker at a time. If `None`, problems
+        are split into about four chunks per worker.
+
+    Returns
+    -------
+    fitted : list
+        Fitted estimators in the same order as `problems`. If a fit raised an
+        error, its entry is a `FitError` instead.
+
+    Notes
+    -----
+    Problems are pickled to send them to workers. Problems which cannot be
+    pickled (e.g. because of lambda constraints) are pickled with
+    `cloudpickle` if it is installed, and are otherwise fit serially in this
+    process.
+    """
+    problems = list(problems)
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    results = [None] * len(problems)
+    payloads, serial = [], []
+    for i, problem in enumerate(problems):
+        payload = _dumps(problem) if n_jobs > 1 else None
+        if payload is None:
+            serial.append(i)
+        else:
+            payloads.append((i, payload))
+    if payloads:
+        chunksize = chunksize or math.ceil(len(payloads) / (4*n_jobs))
+        chunks = [
+            payloads[i:i+chunksize] for i in range(0, len(payloads), chunksize)
+        ]
+        with ProcessPoolExecutor(n_jobs) as executor:
+            futures = [executor.submit(_fit_chunk, chunk) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    for i, result in future.result():
+                        results[i] = pickle.loads(result)
+                except Exception:
+                    message = traceback.format_exc()
+                    for i, _ in chunk:
+                        results[i] = FitError(i, message)
+    for i in serial:
+        results[i] = _fit(i, problems[i])
+    return results
+
+
+def _dumps(obj):
+    """
+    Returns
+    -------
+    payload : bytes or None
+        `obj` pickled with `pickle`, or `cloudpickle` if available, or `None`
+        if it cannot be pickled.
+    """
+    try:
+        return pickle.dumps(obj)
+    except Exception:
+        pass
+    try:
+        import cloudpickle
+        return cloudpickle.dumps(obj)
+    except Exception:
+        return None
+
+
+def _fit(i, problem):
+    """
+    Parameters
+    ----------
+    i : int
+        Index of the problem.
+
+    problem : tuple
+        See `fit_many`.
+
+    Returns
+    -------
+    fitted : estimator or FitError
+    """
+    try:
+        estimator, args = problem[:2]
+        kwargs = problem[2] if len(problem) > 2 else {}
+        return estimator.fit(*args, **kwargs)
+    except Exception:
+        return FitError(i, traceback.format_exc())
+
+
+def _fit_chunk(chunk):
+    """
+    Worker entry point.
+
+    Parameters
+    ----------
+    chunk : list of (int, bytes)
+        Problem indices and pickled problems.
+
+    Returns
+    -------
+    results : list of (int, bytes)
+        Problem indices and pickled fitted estimators or `FitError`s.
+    """
+    results = []
+    for i, payload in chunk:
+        try:
+            result = _fit(i, pickle.loads(payload))
+        except Exception:
+            result = FitError(i, traceback.format_exc())
+        results.append((i, _dumps(result) or pickle.dumps(FitError(
+            i, 'Fitted estimator cannot be pickled'
+        ))))
+    return results
@@ -1,13 +1,19 @@
 """# Smoother"""
 
 from .distribution import Distribution
+from .utils import EntropyObjective, LowRankHessian
 
 import numpy as np
 from scipy.stats import entropy
-from scipy.optimize import Bounds, LinearConstraint, minimize
+from scipy.optimize import Bounds, LinearConstraint, OptimizeResult, minimize
+from scipy import sparse
+from scipy.linalg import qr
+from scipy.sparse.linalg import MatrixRankWarning, spsolve
 
 import json
 import math
+import time
+import warnings
 from random import random
 
 class Smoother(Distribution):
@@ -18,18 +24,35 @@ class Smoother(Distribution):
     Attributes
     ----------
     x : np.array
-        A linearly spaced (`self.num`,) array of points between the lower and 
-        upper bounds of the distribution.
+        A sorted (`num`,) array of points between the lower and upper bounds 
+        of the distribution. Linearly spaced unless a grid is passed to 
+        `fit` or adaptive refinement is used.
 
     f_x : np.array
         The probability density function of `self.x`.
 
     F_x : np.array
         The cumulative distribution function of `self.x`.
+
+    diagnostics : dict
+        Set during `fit`. Contains:
+
+        - `'success'`, `'status'`, `'message'`: from the final optimizer 
+        result. Status 99 means the callback stopped the fit, and 98 means 
+        the optimizer returned a non-finite iterate.
+        - `'nit'`, `'nfev'`, `'njev'`: iterations, loss evaluations, and 
+        gradient evaluations, summed over all grids.
+        - `'time'`: wall time of the fit in seconds.
+        - `'results'`: `scipy.optimize.OptimizeResult` for each grid.
+        - `'objective'`, `'constraints'`: for the objective and each 
+        constraint, a dict with the number of `'calls'` and `'gradient_calls'` 
+        and the total `'time'` and `'gradient_time'` spent in them.
     """    
     def fit(
             self, lb, ub, constraints, 
-            objective=lambda self: self.entropy(), num=50
+            objective=EntropyObjective(), num=50, x=None, refine=0,
+            refine_tol=.1, multires=0, warm_start=False, linear=False,
+            callback=None, method='SLSQP'
         ):
         """
         Parameters
@@ -44,34 +67,514 @@ class Smoother(Distribution):
             Constraints take in a `Smoother` and return a float. Lower values
             indicate that the constraints are satisfied.
 
-        objective : callable, default=lambda self: self.entropy()
+        objective : callable, default=EntropyObjective()
             The objective or smoothing function. The objective function takes 
             a `Smoother` and returns a float. This objective function is
             maximized subject to constraints. By default, it maximizes 
             entropy.
 
+            If the objective and all constraints have a `gradient` method, 
+            the analytic gradient is passed to the optimizer. See 
+            `smoother.utils`.
+
         num : int, default=50
             Number of points on the distribution used for approximation.
 
+        x : np.array or None, default=None
+            Sorted, not necessarily evenly spaced, grid on which to fit the 
+            distribution. If `None`, the grid is `num` linearly spaced points 
+            between `lb` and `ub`. Otherwise, `lb`, `ub`, and `num` are 
+            ignored.
+
+        refine : int, default=0
+            Number of adaptive refinement passes. Each pass adds the midpoint 
+            of every interval over which the density changes by more than 
+            `refine_tol` times its maximum, then refits starting from the 
+            interpolated solution.
+
+        refine_tol : float, default=.1
+            Threshold for adaptive refinement.
+
+        multires : int, default=0
+            Number of coarser grids to solve on first. Level `k` keeps every 
+            `2**k`th point of the grid (and the upper bound), and each 
+            solution is interpolated as the starting point for the next finer 
+            grid.
+
+        warm_start : bool, default=False
+            Indicates that the optimizer should start from the current `f_x` 
+            interpolated onto the new grid instead of a uniform distribution. 
+            This speeds up refitting after a small change to the constraints.
+
+        linear : bool, default=False
+            Indicates that constraints which are linear in `f_x` (i.e. 
+            `MassConstraint` and raw `MomentConstraint`) should be imposed 
+            exactly as linear constraints instead of as penalties. See 
+            `smoother.utils`. Redundant linear constraints (e.g. the mass of
+            the whole grid, or duplicates) are dropped, and inconsistent ones
+            raise a `ValueError`.
+
+        callback : callable or None, default=None
+            Called with the smoother after each optimizer iteration, with 
+            `f_x` set to the current iterate. If it returns `True`, the fit 
+            stops early.
+
+        method : str, default='SLSQP'
+            Optimization method; `'SLSQP'` or `'newton'`. `'SLSQP'` uses 
+            `scipy.optimize.minimize`. `'newton'` is a barrier Newton method 
+            which requires Hessians and solves sparse linear systems, so it 
+            scales to grids of thousands of points. See `smoother.utils`.
+
         Returns
         -------
         self
         """
-        self.x = np.linspace(lb, ub, num=num)
-        self._f_x = np.ones(num) / (ub-lb)
+        x = (
+            np.linspace(lb, ub, num=num) if x is None 
+            else np.asarray(x, dtype=float)
+        )
+        start = time.perf_counter()
         self._constraints = constraints
         self._objective = objective
+        self._linear = linear
+        self._callback = callback
+        self._method = method
+        self._stats = {
+            id(func): dict(calls=0, time=0., gradient_calls=0, gradient_time=0.)
+            for func in [objective] + list(constraints)
+        }
+        self.diagnostics = dict(results=[])
+        grids = [
+            self._coarsen(x, 2**k) for k in range(multires, 0, -1)
+        ] + [x]
+        grids = [grid for grid in grids if grid.shape[0] >= 5] or [x]
+        if not warm_start:
+            self.x = grids[0]
+            self._f_x = np.ones(self.x.shape[0]) / (self.x[-1] - self.x[0])
+            self._clear_cache()
+        stopped = False
+        for grid in grids:
+            stopped = self._minimize(self._start(grid))
+            if stopped:
+                break
+        for _ in range(0 if stopped else refine):
+            grid = self._refine_grid(refine_tol)
+            if grid.shape == self.x.shape:
+                break
+            if self._minimize(self._start(grid)):
+                break
+        self._record_diagnostics(start)
+        del self._constraints, self._objective, self._linear, self._penalties
+        del self._callback, self._method, self._stats, self._nit
+        return self
+
+    def _record_diagnostics(self, start):
+        """
+        Summarizes the optimizer results and evaluation statistics in 
+        `self.diagnostics`.
+
+        Parameters
+        ----------
+        start : float
+            `time.perf_counter()` at the start of the fit.
+        """
+        results = self.diagnostics['results']
+        last = results[-1]
+        self.diagnostics.update(
+            success=bool(last.success),
+            status=last.status,
+            message=last.message,
+            nit=sum([res.get('nit', 0) for res in results]),
+            nfev=sum([res.get('nfev', 0) for res in results]),
+            njev=sum([res.get('njev', 0) for res in results]),
+            time=time.perf_counter() - start,
+            objective=self._stats[id(self._objective)],
+            constraints=[self._stats[id(c)] for c in self._constraints]
+        )
+
+    @staticmethod
+    def _coarsen(x, step):
+        """
+        Parameters
+        ----------
+        x : np.array
+            Grid.
+
+        step : int
+            Keep every `step`th point.
+
+        Returns
+        -------
+        x : np.array
+            Coarsened grid, including the upper bound.
+        """
+        idx = np.arange(0, x.shape[0], step)
+        if idx[-1] != x.shape[0]-1:
+            idx = np.append(idx, x.shape[0]-1)
+        return x[idx]
+
+    def _start(self, x):
+        """
+        Interpolates the current solution onto a new grid and sets `self.x` 
+        to the new grid.
+
+        Parameters
+        ----------
+        x : np.array
+            New grid.
+
+        Returns
+        -------
+        f_x : np.array
+            Normalized starting point for the optimizer on the new grid.
+        """
+        f_x = self._interp(x, self._f_x, self._f_x[0], self._f_x[-1])
+        self.x = x
+        mass = self._w @ f_x
+        return (
+            f_x / mass if mass > 0 
+            else np.ones(x.shape[0]) / (x[-1] - x[0])
+        )
+
+    def _minimize(self, f_x):
+        """
+        Minimizes `self._loss` on the current grid and appends the result 
+        to `self.diagnostics['results']`.
+
+        Parameters
+        ----------
+        f_x : np.array
+            Initial guess.
+
+        Returns
+        -------
+        stopped : bool
+            Indicates that the callback stopped the fit early.
+        """
+        num = self.x.shape[0]
         bounds = Bounds([0]*num, [np.inf]*num)
-        integral_cons = LinearConstraint(1/num * np.ones((1, num)), [1], [1])
-        minimize(
-            self._loss, 
-            self._f_x, 
-            constraints=[integral_cons], 
-            bounds=bounds,
-            options={'disp': False}
+        # rows are (coefficients, lb, ub); the first is the integral constraint
+        rows, self._penalties = [(self._w, 1, 1)], []
+        for constraint in self._constraints:
+            row = (
+                constraint.linear_constraint(self) 
+                if self._linear and hasattr(constraint, 'linear_constraint')
+                else None
+            )
+            if row is None:
+                self._penalties.append(constraint)
+            else:
+                rows.append(row)
+        coef, lb, ub = zip(*self._independent_rows(rows))
+        linear_cons = LinearConstraint(np.vstack(coef), lb, ub)
+        funcs = [self._objective] + self._penalties
+        has_gradient = all([hasattr(func, 'gradient') for func in funcs])
+        has_hessian = all([hasattr(func, 'hessian') for func in funcs])
+        if self._method not in ('SLSQP', 'newton'):
+            raise ValueError(
+                "method must be 'SLSQP' or 'newton', got {}"
+                .format(self._method)
+            )
+        if self._method == 'newton' and not (has_gradient and has_hessian):
+            raise ValueError(
+                "method='newton' requires the objective and all penalty "
+                "constraints to define gradient and hessian methods"
+            )
+        self._nit, self._stopped = 0, False
+        nfev, njev = self._count_calls()
+        try:
+            if self._method == 'newton':
+                res = self._newton(f_x, linear_cons)
+            else:
+                res = minimize(
+                    self._loss, 
+                    f_x, 
+                    method=self._method,
+                    jac=self._gradient if has_gradient else None,
+                    constraints=[linear_cons], 
+                    bounds=bounds,
+                    options={'disp': False},
+                    callback=(
+                        self._iteration_callback if self._callback else None
+                    )
+                )
+        except StopIteration:
+            # raised by the newton solver and older versions of scipy
+            calls, gradient_calls = self._count_calls()
+            res = OptimizeResult(
+                x=self._f_x, success=False, status=99, 
+                message='Stopped by callback', nit=self._nit, 
+                nfev=calls-nfev, njev=gradient_calls-njev
+            )
+        if self._stopped:
+            # some scipy methods report their own status for StopIteration
+            res.success, res.status = False, 99
+            res.message = 'Stopped by callback'
+        if not np.isfinite(res.x).all():
+            # never commit a non-finite iterate
+            res.x, res.success, res.status = f_x, False, 98
+            res.message = 'Non-finite iterate; kept the initial guess'
+        self.diagnostics['results'].append(res)
+        self._loss(res.x)
+        return self._stopped
+
+    @staticmethod
+    def _independent_rows(rows, tol=1e-10):
+        """
+        Removes redundant linear constraints, which make the constraint 
+        Jacobian singular for SLSQP and the KKT system singular for the 
+        newton solver.
+
+        Parameters
+        ----------
+        rows : list of (coef, lb, ub)
+            Linear constraints; the first is the integral constraint.
+
+        tol : float, default=1e-10
+            Relative tolerance for zero coefficients and linear dependence.
+
+        Returns
+        -------
+        rows : list of (coef, lb, ub)
+            `rows` without inequality rows whose coefficients are zero and 
+            which are satisfied, and without equality rows which are linear
+            combinations of the other equality rows.
+        """
+        scale = abs(np.asarray(rows[0][0])).max()
+        inequality, equality = [], []
+        for coef, lb, ub in rows:
+            coef = np.asarray(coef, dtype=float)
+            if lb == ub:
+                equality.append((coef, lb, ub))
+            elif abs(coef).max() > tol * scale:
+                inequality.append((coef, lb, ub))
+            elif not lb <= 0 <= ub:
+                raise ValueError(
+                    'A linear constraint has zero coefficients and cannot be '
+                    'satisfied'
+                )
+        A = np.vstack([coef for coef, _, _ in equality])
+        b = np.array([lb for _, lb, _ in equality], dtype=float)
+        _, R, pivot = qr(A.T, mode='economic', pivoting=True)
+        diag = abs(np.diag(R))
+        rank = int((diag > tol * diag[0]).sum())
+        independent = np.sort(pivot[:rank])
+        # dependent equality rows must agree with the independent ones
+        solution = np.linalg.lstsq(A[independent], b[independent], rcond=None)[0]
+        if (abs(A @ solution - b) > 1e-8 * (1 + abs(b))).any():
+            raise ValueError('The linear constraints are inconsistent')
+        return [equality[i] for i in independent] + inequality
+
+    def _newton(self, f_x, linear_cons, tol=1e-8, max_iter=500):
+        """
+        Minimizes `self._loss` subject to `linear_cons` and `f_x >= 0` with a 
+        primal log-barrier Newton method. Each Newton step solves a sparse 
+        KKT system built from the sparse and low-rank parts of the Hessian, 
+        so the cost per iteration is roughly linear in the grid size for 
+        banded Hessians.
+
+        Parameters
+        ----------
+        f_x : np.array
+            Initial guess.
+
+        linear_cons : scipy.optimize.LinearConstraint
+            Equality constraints.
+
+        tol : float, default=1e-8
+            Relative tolerance for the barrier parameter and Newton 
+            decrement.
+
+        max_iter : int, default=500
+            Maximum number of Newton steps.
+
+        Returns
+        -------
+        result : scipy.optimize.OptimizeResult
+        """
+        A, b = np.atleast_2d(linear_cons.A), np.atleast_1d(linear_cons.ub)
+        if (np.atleast_1d(linear_cons.lb) != b).any():
+            raise ValueError(
+                "method='newton' supports only equality constraints"
+            )
+        f = np.maximum(f_x, 1e-3 * f_x.mean())
+        nfev, njev = self._count_calls()
+        loss = self._loss(f)
+        # n * mu bounds the suboptimality due to the barrier
+        mu = 1e-2 * (
+            np.mean(abs(self._gradient(f) * f)) + (1 + abs(loss)) / f.shape[0]
         )
-        del self._constraints, self._objective
-        return self
+        nit, status = 0, 1
+        while nit < max_iter:
+            barrier = lambda f: self._loss(f) - mu * np.log(f).sum()
+            decrement, infeasibility = np.inf, np.inf
+            while nit < max_iter and (
+                    decrement > tol * (1 + abs(loss)) or infeasibility > tol
+                ):
+                g = self._gradient(f) - mu / f
+                H = self._hessian(f) + sparse.diags(mu / f**2)
+                r = A @ f - b
+                p, lam = self._kkt_solve(H, A, -g, -r)
+                if not (np.isfinite(p).all() and np.isfinite(lam).all()):
+                    status = 2
+                    break
+                neg = p < 0
+                # fraction to the boundary f_x = 0
+                alpha = (
+                    min(1, .99 * (-f[neg] / p[neg]).min()) if neg.any() else 1
+                )
+                # backtracking line search on an l1 merit function
+                rho = 10 * (abs(lam).max() + 1)
+                merit = barrier(f) + rho * abs(r).sum()
+                slope = g @ p - rho * abs(r).sum()
+                while True:
+                    f_new = f + alpha * p
+                    merit_new = barrier(f_new) + rho * abs(A @ f_new - b).sum()
+                    sufficient = merit_new <= merit + 1e-4 * alpha * slope
+                    if sufficient or alpha < 1e-10:
+                        break
+                    alpha /= 2
+                f, nit = f_new, nit + 1
+                loss = self._loss(f)
+                decrement = abs(g @ p)
+                infeasibility = abs(A @ f - b).max()
+                if self._callback:
+                    self._iteration_callback(f)
+            if status == 2:
+                break
+            if nit < max_iter and mu * f.shape[0] < tol * (1 + abs(loss)):
+                status = 0
+                break
+            mu /= 10
+        calls, gradient_calls = self._count_calls()
+        return OptimizeResult(
+            x=f, fun=loss, nit=nit, nfev=calls-nfev, njev=gradient_calls-njev, 
+            status=status, success=status == 0,
+            message={
+                0: 'Optimization terminated successfully',
+                1: 'Iteration limit reached',
+                2: 'Singular KKT system'
+            }[status]
+        )
+
+    @staticmethod
+    def _kkt_solve(H, A, g, r):
+        """
+        Solves the KKT system `[[H, A.T], [A, -delta*I]] @ [p, lam] = [g, r]`.
+
+        The low-rank part `U @ V.T` of `H` is handled by adding the auxiliary 
+        variables `y = V.T @ p`, which keeps the system sparse. `delta` is 
+        zero unless the system is singular, e.g. because the rows of `A` are
+        linearly dependent, in which case a tiny `delta` regularizes it.
+
+        Parameters
+        ----------
+        H : LowRankHessian
+
+        A : (k x num) np.array
+
+        g : (num,) np.array
+
+        r : (k,) np.array
+
+        Returns
+        -------
+        p, lam : (num,) np.array, (k,) np.array
+        """
+        num, k, rank = A.shape[1], A.shape[0], H.U.shape[1]
+        A = sparse.csr_matrix(A)
+        sol = None
+        scale = abs(A).max()**2 / (1 + abs(H.sparse).max())
+        for delta in (0, 1e-10 * scale):
+            blocks = [[H.sparse, A.T], [A, -delta*sparse.identity(k)]]
+            if rank:
+                blocks[0].append(sparse.csr_matrix(H.U))
+                blocks[1].append(None)
+                blocks.append([
+                    sparse.csr_matrix(H.V.T), None, -sparse.identity(rank)
+                ])
+            K = sparse.bmat(blocks, format='csc')
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', MatrixRankWarning)
+                try:
+                    sol = spsolve(K, np.concatenate([g, r, np.zeros(rank)]))
+                except MatrixRankWarning:
+                    continue
+            if np.isfinite(sol).all():
+                break
+        if sol is None:
+            sol = np.full(num + k + rank, np.nan)
+        return sol[:num], sol[num:num+k]
+
+    def _count_calls(self):
+        """
+        Returns
+        -------
+        calls, gradient_calls : int, int
+            Number of calls to the objective and its gradient so far.
+        """
+        stats = self._stats[id(self._objective)]
+        return stats['calls'], stats['gradient_calls']
+
+    def _iteration_callback(self, xk):
+        """
+        Wraps the user callback for `scipy.optimize.minimize` and the newton
+        solver.
+
+        Parameters
+        ----------
+        xk : np.array
+            Current iterate.
+        """
+        self._nit += 1
+        if xk is not self._f_x:
+            self._f_x = np.array(xk)
+            self._clear_cache()
+        if self._callback(self):
+            self._stopped = True
+            raise StopIteration
+
+    def _call(self, func, gradient=False):
+        """
+        Calls an objective or constraint and records its call count and 
+        evaluation time in `self._stats`.
+
+        Parameters
+        ----------
+        func : callable
+            Objective or constraint.
+
+        gradient : bool, default=False
+            Indicates that `func.gradient` should be called instead.
+
+        Returns
+        -------
+        output : float or np.array
+        """
+        start = time.perf_counter()
+        output = func.gradient(self) if gradient else func(self)
+        stats = self._stats[id(func)]
+        prefix = 'gradient_' if gradient else ''
+        stats[prefix+'calls'] += 1
+        stats[prefix+'time'] += time.perf_counter() - start
+        return output
+
+    def _refine_grid(self, tol):
+        """
+        Parameters
+        ----------
+        tol : float
+            Intervals over which the density changes by more than `tol` times 
+            its maximum are split.
+
+        Returns
+        -------
+        x : np.array
+            Refined grid.
+        """
+        split = abs(np.diff(self._f_x)) > tol * self._f_x.max()
+        midpoints = ((self.x[:-1] + self.x[1:]) / 2)[split]
+        return np.sort(np.concatenate([self.x, midpoints]))
 
     def _loss(self, f_x=None):
         """
@@ -86,6 +589,54 @@ class Smoother(Distribution):
             Loss is the negative of the objective function plus loss from
             constraints.
         """
-        self._f_x = self._f_x if f_x is None else f_x
-        constraint_loss = sum([constraint(self) for constraint in self._constraints])
-        return -self._objective(self) + constraint_loss
\ No newline at end of file
+        if f_x is not None:
+            self._f_x = f_x
+            self._clear_cache()
+        constraint_loss = sum(
+            [self._call(constraint) for constraint in self._penalties]
+        )
+        return -self._call(self._objective) + constraint_loss
+
+    def _gradient(self, f_x=None):
+        """
+        Parameters
+        ----------
+        f_x : np.array or None, default=None
+            Resets `self._f_x`; users should avoid passing this parameter.
+
+        Returns
+        -------
+        gradient : np.array
+            Gradient of `self._loss` with respect to `self._f_x`.
+        """
+        if f_x is not None and f_x is not self._f_x:
+            self._f_x = f_x
+            self._clear_cache()
+        constraint_gradient = sum(
+            [self._call(constraint, True) for constraint in self._penalties], 
+            np.zeros(self.x.shape[0])
+        )
+        return -self._call(self._objective, True) + constraint_gradient
+
+    def _hessian(self, f_x=None):
+        """
+        Parameters
+        ----------
+        f_x : np.array or None, default=None
+            Resets `self._f_x`; users should avoid passing this parameter.
+
+        Returns
+        -------
+        hessian : LowRankHessian
+            Hessian of `self._loss` with respect to `self._f_x`.
+        """
+        if f_x is not None and f_x is not self._f_x:
+            self._f_x = f_x
+            self._clear_cache()
+        hessian = (
+            LowRankHessian(num=self.x.shape[0]) 
+            - self._objective.hessian(self)
+        )
+        for constraint in self._penalties:
+            hessian = hessian + constraint.hessian(self)
+        return hessian
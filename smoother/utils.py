@@ -1,6 +1,177 @@
-"""# Objective functions and constraints"""
+"""# Objective functions and constraints
+
+Objectives and constraints are callables which take a `Smoother` and return 
+a float. They may also define a `gradient` method which takes a `Smoother` 
+and returns the (num,) gradient of the callable's value with respect to 
+`smoother.f_x`. If the objective and all constraints define `gradient`, 
+`Smoother.fit` passes the analytic gradient to the optimizer. Otherwise, the 
+optimizer falls back on finite differences.
+
+Constraints which are linear in `f_x` may also define a `linear_constraint` 
+method which takes a `Smoother` and returns `(coefficients, lb, ub)` such that 
+the constraint holds when `lb <= coefficients @ smoother.f_x <= ub`, or `None` 
+if the constraint is not linear. `Smoother.fit(..., linear=True)` imposes 
+these constraints exactly.
+
+Objectives and constraints may also define a `hessian` method which takes a 
+`Smoother` and returns the (num x num) Hessian of the callable's value with 
+respect to `smoother.f_x` as a `scipy.sparse` matrix or a `LowRankHessian`. 
+`Smoother.fit(..., method='newton')` uses these Hessians; it requires the 
+objective and all penalty constraints to define them.
+"""
 
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import aslinearoperator
+
+
+class LowRankHessian():
+    """
+    A Hessian of the form `sparse + U @ V.T`, where `sparse` is a sparse 
+    (e.g. diagonal or banded) matrix and `U` and `V` are tall, thin arrays. 
+    Objectives and constraints return this from their `hessian` method when 
+    the Hessian is not sparse itself, so that it never has to be formed as a 
+    dense matrix.
+
+    Parameters
+    ----------
+    sparse_part : (num x num) scipy.sparse matrix or None, default=None
+        Sparse part of the Hessian. If `None`, the sparse part is 0.
+
+    U, V : (num x rank) np.array or None, default=None
+        Factors of the low-rank part of the Hessian. If `None`, the low-rank 
+        part is 0.
+
+    num : int or None, default=None
+        Size of the Hessian. Required only if `sparse_part`, `U`, and `V` are 
+        all `None`.
+
+    Attributes
+    ----------
+    sparse : (num x num) scipy.sparse.csr_matrix
+        Sparse part of the Hessian.
+
+    U, V : (num x rank) np.array
+        Factors of the low-rank part of the Hessian.
+    """
+    def __init__(self, sparse_part=None, U=None, V=None, num=None):
+        if num is None:
+            num = (sparse_part if sparse_part is not None else U).shape[0]
+        self.sparse = (
+            sparse.csr_matrix((num, num)) if sparse_part is None 
+            else sparse.csr_matrix(sparse_part)
+        )
+        self.U = np.zeros((num, 0)) if U is None else np.reshape(U, (num, -1))
+        self.V = np.zeros((num, 0)) if V is None else np.reshape(V, (num, -1))
+
+    @classmethod
+    def outer(cls, a, b, scale=1):
+        """
+        Returns
+        -------
+        hessian : LowRankHessian
+            Rank-one Hessian `scale * np.outer(a, b)`.
+        """
+        return cls(U=scale*a, V=b)
+
+    def __add__(self, other):
+        if not isinstance(other, LowRankHessian):
+            other = LowRankHessian(other)
+        return LowRankHessian(
+            self.sparse + other.sparse, 
+            np.hstack([self.U, other.U]), 
+            np.hstack([self.V, other.V])
+        )
+
+    __radd__ = __add__
+
+    def __mul__(self, scalar):
+        return LowRankHessian(scalar*self.sparse, scalar*self.U, self.V)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return -1 * self
+
+    def __sub__(self, other):
+        return self + -other
+
+    def aslinearoperator(self):
+        """
+        Returns
+        -------
+        hessian : scipy.sparse.linalg.LinearOperator
+        """
+        return aslinearoperator(self.sparse) + aslinearoperator(
+            self.U
+        ) @ aslinearoperator(self.V.T)
+
+    def toarray(self):
+        """
+        Returns
+        -------
+        hessian : (num x num) np.array
+            Dense Hessian; for testing and small grids only.
+        """
+        return self.sparse.toarray() + self.U @ self.V.T
+
+
+class EntropyObjective():
+    """
+    A `Smoother` objective function which maximizes entropy. This is the 
+    default `Smoother` objective.
+    """
+    def __call__(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : `Smoother`
+            The smoother to which this objective function applies.
+
+        Returns
+        -------
+        value : float
+            Entropy of the smoother.
+        """
+        return smoother.entropy()
+
+    def gradient(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : `Smoother`
+
+        Returns
+        -------
+        gradient : (num,) np.array
+            Gradient of the entropy with respect to `smoother.f_x`.
+        """
+        w, f_x = smoother._w, smoother._f_x
+        mass = w @ f_x
+        log_p = np.log(np.maximum(f_x / mass, np.finfo(float).tiny))
+        return w * (-log_p - smoother.entropy()) / mass
+
+    def hessian(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : `Smoother`
+
+        Returns
+        -------
+        hessian : LowRankHessian
+            Hessian of the entropy with respect to `smoother.f_x`; a diagonal 
+            matrix plus a rank-three correction.
+        """
+        w, f_x = smoother._w, smoother._f_x
+        mass = w @ f_x
+        grad = self.gradient(smoother)
+        diag = -w / (mass * np.maximum(f_x, np.finfo(float).tiny))
+        return LowRankHessian(
+            sparse.diags(diag), 
+            np.column_stack([w / mass**2, -grad / mass, -w / mass]),
+            np.column_stack([w, w, grad])
+        )
 
 
 class DerivativeObjective():
@@ -29,11 +200,77 @@ class DerivativeObjective():
         value : float
             Approximate mean square derivative over all points of the
             distribution.
+
+        Notes
+        -----
+        The derivative is taken with respect to `smoother.x` rescaled to the 
+        unit interval using divided differences, so the grid need not be 
+        evenly spaced.
+        """
+        deriv = self._matrix(smoother) @ smoother._f_x
+        return -self._weight()*(deriv**2).mean()
+
+    def gradient(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : `Smoother`
+
+        Returns
+        -------
+        gradient : (num,) np.array
+            Gradient of the objective with respect to `smoother.f_x`.
+        """
+        D = self._matrix(smoother)
+        deriv = D @ smoother._f_x
+        return -2*self._weight() / deriv.shape[0] * (D.T @ deriv)
+
+    def hessian(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : `Smoother`
+
+        Returns
+        -------
+        hessian : (num x num) scipy.sparse.csr_matrix
+            Hessian of the objective with respect to `smoother.f_x`. The 
+            objective is quadratic, so this is constant with bandwidth `d`.
         """
-        weight = 1e-3/self.d**2 if self.weight is None else self.weight
-        delta = 1 / smoother.x.shape[0]
-        deriv = np.diff(smoother._f_x, n=self.d) / delta**self.d
-        return -weight*(deriv**2).mean()
+        D = self._matrix(smoother)
+        return (-2*self._weight() / D.shape[0] * (D.T @ D)).tocsr()
+
+    def _weight(self):
+        return 1e-3/self.d**2 if self.weight is None else self.weight
+
+    def _matrix(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : `Smoother`
+
+        Returns
+        -------
+        D : (num - d x num) scipy.sparse.csr_matrix
+            Banded divided-difference matrix which maps `smoother.f_x` to 
+            its `d`th derivative. Cached for the smoother's current grid.
+        """
+        x = smoother.x
+        # one attribute, so that the grid and its matrix are read together
+        cached = getattr(self, '_cached_matrix', None)
+        if cached is not None and cached[0] is x:
+            return cached[1]
+        scale = x[-1] - x[0]
+        u = (x - x[0]) / scale
+        D = scale * sparse.identity(x.shape[0], format='csr')
+        for _ in range(self.d):
+            n = u.shape[0]
+            diff = sparse.diags([-np.ones(n-1), np.ones(n-1)], [0, 1], (n-1, n))
+            D = sparse.diags(1/np.diff(u)) @ diff @ D
+            u = (u[:-1] + u[1:]) / 2
+        D = D.tocsr()
+        self._cached_matrix = x, D
+        return D
 
 
 class MassConstraint():
@@ -72,10 +309,73 @@ class MassConstraint():
         -------
         loss : float
         """
-        weight = 5e2 if self.weight is None else self.weight
+        weight = self._weight()
         curr_mass = smoother.cdf(self.ub) - smoother.cdf(self.lb)
         return weight * (curr_mass - self.mass)**2
 
+    def gradient(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : Smoother
+
+        Returns
+        -------
+        gradient : (num,) np.array
+            Gradient of the loss with respect to `smoother.f_x`.
+        """
+        weight = self._weight()
+        w, f_x = smoother._w, smoother._f_x
+        mass_weights = (
+            smoother._cdf_weights(self.ub) - smoother._cdf_weights(self.lb)
+        )
+        total = w @ f_x
+        curr_mass = mass_weights @ f_x / total
+        return 2*weight * (curr_mass - self.mass) * (
+            mass_weights - curr_mass * w
+        ) / total
+
+    def linear_constraint(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : Smoother
+
+        Returns
+        -------
+        coefficients, lb, ub : (num,) np.array, float, float
+            The mass between `self.lb` and `self.ub` is `self.mass` when 
+            `coefficients @ smoother.f_x` is 0.
+        """
+        mass_weights = (
+            smoother._cdf_weights(self.ub) - smoother._cdf_weights(self.lb)
+        )
+        return mass_weights - self.mass * smoother._w, 0, 0
+
+    def hessian(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : Smoother
+
+        Returns
+        -------
+        hessian : LowRankHessian
+            Gauss-Newton approximation of the Hessian of the loss with 
+            respect to `smoother.f_x`; positive semi-definite and rank-one.
+        """
+        weight = self._weight()
+        w, f_x = smoother._w, smoother._f_x
+        mass_weights = (
+            smoother._cdf_weights(self.ub) - smoother._cdf_weights(self.lb)
+        )
+        total = w @ f_x
+        mass_gradient = (mass_weights - mass_weights @ f_x / total * w) / total
+        return LowRankHessian.outer(mass_gradient, mass_gradient, 2*weight)
+
+    def _weight(self):
+        return 5e2 if self.weight is None else self.weight
+
 
 class MomentConstraint():
     """
@@ -117,9 +417,64 @@ class MomentConstraint():
         -------
         loss : float
         """
-        weight = (
+        moment = smoother.moment(self.degree, self.type_, self.norm)
+        return self._weight(smoother) * (moment - self.value)**2
+
+    def gradient(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : Smoother
+
+        Returns
+        -------
+        gradient : (num,) np.array
+            Gradient of the loss with respect to `smoother.f_x`.
+        """
+        moment = smoother.moment(self.degree, self.type_, self.norm)
+        return 2*self._weight(smoother) * (moment - self.value) * (
+            smoother._moment_gradient(self.degree, self.type_, self.norm)
+        )
+
+    def linear_constraint(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : Smoother
+
+        Returns
+        -------
+        coefficients, lb, ub : (num,) np.array, float, float or None
+            The moment equals `self.value` when `coefficients @ smoother.f_x` 
+            is 0. Only raw moments are linear in `f_x`; for other types of 
+            moments, return `None`.
+        """
+        if self.type_ != 'raw':
+            return None
+        value = self.value**self.degree if self.norm else self.value
+        return smoother._w * (smoother.x**self.degree - value), 0, 0
+
+    def hessian(self, smoother):
+        """
+        Parameters
+        ----------
+        smoother : Smoother
+
+        Returns
+        -------
+        hessian : LowRankHessian
+            Gauss-Newton approximation of the Hessian of the loss with 
+            respect to `smoother.f_x`; positive semi-definite and rank-one.
+        """
+        moment_gradient = smoother._moment_gradient(
+            self.degree, self.type_, self.norm
+        )
+        return LowRankHessian.outer(
+            moment_gradient, moment_gradient, 2*self._weight(smoother)
+        )
+
+    def _weight(self, smoother):
+        return (
             5e2 / (smoother.x[-1] - smoother.x[0])**2 if self.weight is None
             else self.weight
-        )
-        moment = smoother.moment(self.degree, self.type_, self.norm)
-        return weight * (moment - self.value)**2
\ No newline at end of file
+        )
\ No newline at end of file